@@ -1,24 +1,746 @@
+import argparse
 import asyncio
 import websockets
 import json
 import logging
+import base64
+import struct
+import time
+import os
+import re
+import mmap
+import bisect
+import queue
+import threading
+import atexit
+import signal
+import multiprocessing
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from logging.handlers import QueueHandler, QueueListener
+from urllib.parse import parse_qs
 from datetime import datetime
+from websockets.frames import Frame, Opcode, prepare_data
+from websockets.protocol import State
 
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
+    format=LOG_FORMAT
 )
 logger = logging.getLogger(__name__)
 
+class DeferredQueueHandler(QueueHandler):
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+class RateLimitFilter(logging.Filter):
+    def __init__(self, interval=5.0, level=logging.WARNING):
+        super().__init__()
+        self.interval = interval
+        self.level = level
+        self.sites = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < self.level or self.interval <= 0:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self.lock:
+            site = self.sites.get(key)
+            if site is not None and now - site[0] < self.interval:
+                site[1] += 1
+                return False
+            suppressed = site[1] if site is not None else 0
+            self.sites[key] = [now, 0]
+        if suppressed:
+            record.msg = f"{record.getMessage()} (suppressed {suppressed} repeats)"
+            record.args = None
+        return True
+
+def start_log_listener(handlers, rate_limit_interval=5.0):
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter(rate_limit_interval))
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(queue_handler)
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+class LogAggregator:
+    def __init__(self, interval=10.0, title="Summary"):
+        self.interval = interval
+        self.title = title
+        self.counts = OrderedDict()
+        self.started = time.monotonic()
+
+    def count(self, event, value=1):
+        self.counts[event] = self.counts.get(event, 0) + value
+        if time.monotonic() - self.started >= self.interval:
+            self.flush()
+
+    def flush(self):
+        counts, elapsed = self.counts, time.monotonic() - self.started
+        self.counts = OrderedDict()
+        self.started = time.monotonic()
+        if counts:
+            logger.info(f"{self.title} for last {elapsed:.0f}s: " +
+                        ", ".join(f"{event}={value}" for event, value in counts.items()))
+
+FRAME_MAGIC = b'CV'
+FRAME_PROTOCOL_VERSION = 1
+FRAME_TYPE_VIDEO = 1
+FRAME_TYPE_DELTA = 2
+FRAME_HEADER = struct.Struct('!2sBBIddI')
+BINARY_PROTOCOL = "binary_v1"
+JSON_PROTOCOL = "json"
+SUPPORTED_PROTOCOLS = (BINARY_PROTOCOL, JSON_PROTOCOL)
+BINARY_FRAME_PREFIX = FRAME_MAGIC + bytes((FRAME_PROTOCOL_VERSION, FRAME_TYPE_VIDEO))
+BINARY_DELTA_PREFIX = FRAME_MAGIC + bytes((FRAME_PROTOCOL_VERSION, FRAME_TYPE_DELTA))
+KEYFRAME_ID_KEY = b'"keyframe_id"'
+RELAY_FEATURES = ("delta",)
+JSON_FRAME_PREFIX = '{"type": "video_frame"'
+JSON_STREAM_ID_KEY = '"stream_id": "'
+SEGMENT_INDEX_ENTRY = struct.Struct('!dQI')
+SOURCE_TIER = "source"
+TUNING_COMMANDS = ("update_threshold", "set_config")
+PRODUCER_QUERIES = {"get_metrics": "metrics", "get_detections": "detections"}
+REQUEST_FIELDS = ("threshold", "values", "key", "value", "since", "until", "class_id", "class", "limit")
+MAX_PENDING_REQUESTS = 64
+
+def pack_binary_frame(frame_id, timestamp, encode_timestamp, metadata, jpeg_bytes):
+    metadata_bytes = json.dumps(metadata, separators=(',', ':')).encode('utf-8')
+    header = FRAME_HEADER.pack(FRAME_MAGIC, FRAME_PROTOCOL_VERSION, FRAME_TYPE_VIDEO,
+                               frame_id & 0xFFFFFFFF, timestamp, encode_timestamp, len(metadata_bytes))
+    return b''.join((header, metadata_bytes, jpeg_bytes))
+
+def unpack_binary_frame(message):
+    if len(message) < FRAME_HEADER.size:
+        raise ValueError("Binary frame is shorter than header")
+    magic, version, frame_type, frame_id, timestamp, encode_timestamp, metadata_length = \
+        FRAME_HEADER.unpack_from(message)
+    if magic != FRAME_MAGIC or version != FRAME_PROTOCOL_VERSION:
+        raise ValueError(f"Unsupported binary frame: magic={magic!r}, version={version}")
+    metadata_end = FRAME_HEADER.size + metadata_length
+    metadata = json.loads(message[FRAME_HEADER.size:metadata_end])
+    return {
+        "frame_type": frame_type,
+        "frame_id": frame_id,
+        "timestamp": timestamp,
+        "encode_timestamp": encode_timestamp,
+        "metadata": metadata,
+        "jpeg": memoryview(message)[metadata_end:]
+    }
+
+def pack_delta_frame(frame_id, timestamp, encode_timestamp, metadata, tiles):
+    metadata = dict(metadata, tiles=[[x, y, w, h, len(data)] for x, y, w, h, data in tiles])
+    metadata_bytes = json.dumps(metadata, separators=(',', ':')).encode('utf-8')
+    header = FRAME_HEADER.pack(FRAME_MAGIC, FRAME_PROTOCOL_VERSION, FRAME_TYPE_DELTA,
+                               frame_id & 0xFFFFFFFF, timestamp, encode_timestamp, len(metadata_bytes))
+    return b''.join([header, metadata_bytes] + [data for *_, data in tiles])
+
+def unpack_delta_tiles(frame):
+    tiles = []
+    offset = 0
+    for x, y, w, h, length in frame["metadata"].get("tiles", []):
+        tiles.append((x, y, w, h, bytes(frame["jpeg"][offset:offset + length])))
+        offset += length
+    return tiles
+
+def is_keyframe(message):
+    metadata_length = FRAME_HEADER.unpack_from(message)[-1]
+    return message.find(KEYFRAME_ID_KEY, FRAME_HEADER.size, FRAME_HEADER.size + metadata_length) >= 0
+
+def binary_delta_to_json(message):
+    frame = unpack_binary_frame(message)
+    message_data = {
+        "type": "video_delta",
+        "frame_id": frame["frame_id"],
+        "timestamp": frame["timestamp"]
+    }
+    message_data.update(frame["metadata"])
+    message_data["tiles"] = [{"x": x, "y": y, "w": w, "h": h, "data": base64.b64encode(data).decode('utf-8')}
+                             for x, y, w, h, data in unpack_delta_tiles(frame)]
+    return json.dumps(message_data)
+
+def binary_frame_to_json(message):
+    frame = unpack_binary_frame(message)
+    message_data = {
+        "type": "video_frame",
+        "data": base64.b64encode(frame["jpeg"]).decode('utf-8'),
+        "frame_id": frame["frame_id"],
+        "timestamp": frame["timestamp"]
+    }
+    message_data.update(frame["metadata"])
+    return json.dumps(message_data)
+
+def json_frame_to_binary(data):
+    metadata = {key: value for key, value in data.items()
+                if key not in ("type", "data", "frame_id", "timestamp")}
+    timestamp = data.get("timestamp", 0.0)
+    return pack_binary_frame(data.get("frame_id", 0), timestamp, timestamp,
+                             metadata, base64.b64decode(data["data"]))
+
+def binary_frame_stream_id(message):
+    metadata_length = FRAME_HEADER.unpack_from(message)[-1]
+    return json.loads(message[FRAME_HEADER.size:FRAME_HEADER.size + metadata_length]).get("stream_id")
+
+def json_frame_stream_id(message):
+    start = message.rfind(JSON_STREAM_ID_KEY)
+    if start < 0:
+        return None
+    start += len(JSON_STREAM_ID_KEY)
+    return message[start:message.find('"', start)]
+
+def scale_detections(detections, scale_x, scale_y):
+    scaled = []
+    for detection in detections:
+        xmin, ymin, xmax, ymax = detection['bbox']
+        scaled.append(dict(detection, bbox=[int(xmin * scale_x), int(ymin * scale_y),
+                                            int(xmax * scale_x), int(ymax * scale_y)]))
+    return scaled
+
+def render_renditions(jpeg_bytes, settings):
+    import cv2
+    import numpy as np
+    
+    image = cv2.imdecode(np.frombuffer(jpeg_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    height, width = image.shape[:2]
+    results = []
+    for scale, quality in settings:
+        resized = image
+        if scale < 1.0:
+            size = (max(1, int(width * scale)), max(1, int(height * scale)))
+            resized = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        _, buffer = cv2.imencode('.jpg', resized, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        results.append((buffer.tobytes(), resized.shape[1], resized.shape[0]))
+    return results
+
+def composite_tiles(canvas, keyframe_jpeg, tiles, quality):
+    import cv2
+    import numpy as np
+    
+    if keyframe_jpeg is not None:
+        canvas = cv2.imdecode(np.frombuffer(keyframe_jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+    for x, y, w, h, data in tiles:
+        tile = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if tile is not None:
+            canvas[y:y + h, x:x + w] = tile[:h, :w]
+    _, buffer = cv2.imencode('.jpg', canvas, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return canvas, buffer.tobytes()
+
+class PreparedFrame:
+    def __init__(self, message, stream_id=None):
+        self.stream_id = stream_id
+        self.opcode, self.data = prepare_data(message)
+        self.wire = Frame(Opcode(self.opcode), self.data).serialize(mask=False, extensions=[])
+
+    def write_to(self, client):
+        if client.extensions:
+            client.write_frame_sync(True, self.opcode, self.data)
+        else:
+            client.transport.write(self.wire)
+
+class CachedFrame:
+    def __init__(self, binary_message=None, json_message=None, stream_id=None, delta=False):
+        self.binary_message = binary_message
+        self.json_message = json_message
+        self.stream_id = stream_id
+        self.delta = delta
+        self.received_at = time.time()
+        self.prepared = {}
+
+    def prepared_for(self, protocol):
+        prepared = self.prepared.get(protocol)
+        if prepared is None:
+            if protocol == BINARY_PROTOCOL:
+                if self.binary_message is None:
+                    self.binary_message = json_frame_to_binary(json.loads(self.json_message))
+                prepared = PreparedFrame(self.binary_message, self.stream_id)
+            else:
+                if self.json_message is None:
+                    convert = binary_delta_to_json if self.delta else binary_frame_to_json
+                    self.json_message = convert(self.binary_message)
+                prepared = PreparedFrame(self.json_message, self.stream_id)
+            self.prepared[protocol] = prepared
+        return prepared
+
+class FrameCache:
+    def __init__(self, max_streams=16):
+        self.max_streams = max_streams
+        self.frames = OrderedDict()
+
+    def put(self, stream_id, frame):
+        self.frames[stream_id] = frame
+        self.frames.move_to_end(stream_id)
+        while len(self.frames) > self.max_streams:
+            self.frames.popitem(last=False)
+
+    def get(self, stream_id):
+        frame = self.frames.get(stream_id)
+        if frame is not None:
+            self.frames.move_to_end(stream_id)
+        return frame
+
+    def stats(self):
+        now = time.time()
+        return {stream_id: {"age": round(now - frame.received_at, 3)} for stream_id, frame in self.frames.items()}
+
+class DeltaComposite:
+    def __init__(self, stream_id):
+        self.stream_id = stream_id
+        self.keyframe_id = None
+        self.keyframe_jpeg = None
+        self.tiles = OrderedDict()
+        self.dirty = set()
+        self.reset_canvas = False
+        self.canvas = None
+        self.latest = None
+        self.sync_frame = None
+        self.keyframe_requested = False
+        self.keyframes = 0
+        self.deltas = 0
+        self.keyframe_bytes = 0
+        self.delta_bytes = 0
+
+    def apply(self, binary_message, delta):
+        frame = unpack_binary_frame(binary_message)
+        if not delta:
+            self.keyframe_id = frame["metadata"].get("keyframe_id", frame["frame_id"])
+            self.keyframe_jpeg = bytes(frame["jpeg"])
+            self.tiles.clear()
+            self.dirty.clear()
+            self.reset_canvas = True
+            self.keyframe_requested = False
+            self.keyframes += 1
+            self.keyframe_bytes += len(binary_message)
+        elif self.keyframe_jpeg is None or frame["metadata"].get("keyframe_id") != self.keyframe_id:
+            return False
+        else:
+            for x, y, w, h, data in unpack_delta_tiles(frame):
+                self.tiles[(x, y)] = (w, h, data)
+                self.dirty.add((x, y))
+            self.deltas += 1
+            self.delta_bytes += len(binary_message)
+        self.latest = frame
+        self.sync_frame = None
+        return True
+
+    def metadata(self):
+        metadata = dict(self.latest["metadata"])
+        metadata.pop("tiles", None)
+        return metadata
+
+    def sync(self):
+        if self.sync_frame is None:
+            metadata = self.metadata()
+            width, height = metadata.get("resolution") or (0, 0)
+            tiles = [(0, 0, width, height, self.keyframe_jpeg)]
+            tiles += [(x, y, w, h, data) for (x, y), (w, h, data) in self.tiles.items()]
+            message = pack_delta_frame(self.latest["frame_id"], self.latest["timestamp"],
+                                       self.latest["encode_timestamp"], metadata, tiles)
+            self.sync_frame = CachedFrame(message, stream_id=self.stream_id, delta=True)
+        return self.sync_frame
+
+    def take_changes(self):
+        keyframe_jpeg = self.keyframe_jpeg if self.reset_canvas or self.canvas is None else None
+        tiles = [(*key, *self.tiles[key]) for key in self.dirty]
+        self.reset_canvas = False
+        self.dirty.clear()
+        return keyframe_jpeg, tiles
+
+    def stats(self):
+        frames = self.keyframes + self.deltas
+        full_bytes = self.keyframe_bytes / self.keyframes * frames if self.keyframes else 0
+        sent_bytes = self.keyframe_bytes + self.delta_bytes
+        return {
+            "keyframes": self.keyframes,
+            "deltas": self.deltas,
+            "tiles": len(self.tiles),
+            "bytes_received": sent_bytes,
+            "full_frame_bytes_estimate": int(full_bytes),
+            "savings": round(1 - sent_bytes / full_bytes, 3) if full_bytes else 0.0
+        }
+
+class ClientMailbox:
+    def __init__(self, websocket, max_frames):
+        self.websocket = websocket
+        self.protocol = JSON_PROTOCOL
+        self.tier = SOURCE_TIER
+        self.max_frames = max_frames
+        self.frames = deque()
+        self.control = deque()
+        self.wakeup = asyncio.Event()
+        self.drained = asyncio.Event()
+        self.frames_enqueued = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.control_sent = 0
+        self.subscriptions = set()
+        self.subscribe_all = False
+        self.delta = False
+        self.synced = set()
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+
+    def push_frame(self, prepared):
+        if len(self.frames) >= self.max_frames:
+            dropped = self.frames.popleft()
+            self.frames_dropped += 1
+            if dropped.stream_id in self.synced:
+                self.synced.discard(dropped.stream_id)
+                self.frames = deque(frame for frame in self.frames if frame.stream_id != dropped.stream_id)
+        self.frames.append(prepared)
+        self.frames_enqueued += 1
+        self.wakeup.set()
+
+    def push_control(self, message):
+        self.control.append(PreparedFrame(message))
+        self.wakeup.set()
+
+    async def wait_for_space(self):
+        while len(self.frames) >= self.max_frames:
+            self.drained.clear()
+            await self.drained.wait()
+
+    async def run(self):
+        try:
+            while True:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                while self.control or self.frames:
+                    if self.websocket.state is not State.OPEN:
+                        return
+                    if self.control:
+                        self.control.popleft().write_to(self.websocket)
+                        self.control_sent += 1
+                    else:
+                        self.frames.popleft().write_to(self.websocket)
+                        self.frames_sent += 1
+                        self.drained.set()
+                    await self.websocket.drain()
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        except Exception as e:
+            logger.error(f"Mailbox sender error for {self.websocket.remote_address}: {e}")
+
+    def stats(self):
+        return {
+            "address": self.websocket.remote_address[0],
+            "protocol": self.protocol,
+            "tier": self.tier,
+            "delta": self.delta,
+            "subscriptions": sorted(self.subscriptions),
+            "queue_depth": len(self.frames),
+            "control_queue_depth": len(self.control),
+            "frames_enqueued": self.frames_enqueued,
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped,
+            "control_sent": self.control_sent
+        }
+
+class SegmentRecorder:
+    def __init__(self, directory, segment_seconds=60, max_segments=60, queue_size=256):
+        self.directory = directory
+        self.segment_seconds = segment_seconds
+        self.max_segments = max_segments
+        self.queue = queue.Queue(queue_size)
+        self.open_segments = {}
+        self.frames_recorded = 0
+        self.frames_dropped = 0
+        self.thread = None
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.thread = threading.Thread(target=self.writer_loop, name="segment-recorder", daemon=True)
+        self.thread.start()
+        logger.info(f"Recording frames to {self.directory}")
+
+    def stop(self):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join(timeout=5.0)
+            self.thread = None
+
+    def record(self, stream_id, binary_message=None, json_message=None):
+        try:
+            self.queue.put_nowait((stream_id, binary_message, json_message))
+        except queue.Full:
+            self.frames_dropped += 1
+
+    def stream_directory(self, stream_id):
+        return os.path.join(self.directory, re.sub(r'[^A-Za-z0-9_.-]', '_', stream_id))
+
+    def list_segments(self, stream_id):
+        directory = self.stream_directory(stream_id)
+        try:
+            names = [name[:-4] for name in os.listdir(directory) if name.endswith('.idx')]
+        except FileNotFoundError:
+            return []
+        return [(int(name) / 1000.0, os.path.join(directory, name)) for name in sorted(names, key=int)]
+
+    @staticmethod
+    def read_index(base_path):
+        with open(base_path + '.idx', 'rb') as file:
+            index = file.read()
+        usable = len(index) - len(index) % SEGMENT_INDEX_ENTRY.size
+        return list(SEGMENT_INDEX_ENTRY.iter_unpack(index[:usable]))
+
+    def writer_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            try:
+                self.write_frame(*item)
+            except (OSError, ValueError, KeyError, struct.error) as e:
+                logger.error(f"Recording error for stream {item[0]}: {e}")
+        for data_file, index_file, _, _ in self.open_segments.values():
+            data_file.close()
+            index_file.close()
+        self.open_segments.clear()
+
+    def write_frame(self, stream_id, binary_message, json_message):
+        if binary_message is None:
+            binary_message = json_frame_to_binary(json.loads(json_message))
+        timestamp = FRAME_HEADER.unpack_from(binary_message)[4]
+        
+        segment = self.open_segments.get(stream_id)
+        if segment is None or timestamp - segment[2] >= self.segment_seconds:
+            segment = self.rotate(stream_id, timestamp)
+        data_file, index_file, started, offset = segment
+        
+        data_file.write(binary_message)
+        data_file.flush()
+        index_file.write(SEGMENT_INDEX_ENTRY.pack(timestamp, offset, len(binary_message)))
+        index_file.flush()
+        self.open_segments[stream_id] = (data_file, index_file, started, offset + len(binary_message))
+        self.frames_recorded += 1
+
+    def rotate(self, stream_id, timestamp):
+        previous = self.open_segments.pop(stream_id, None)
+        if previous is not None:
+            previous[0].close()
+            previous[1].close()
+        
+        directory = self.stream_directory(stream_id)
+        os.makedirs(directory, exist_ok=True)
+        base_path = os.path.join(directory, str(int(timestamp * 1000)))
+        segment = (open(base_path + '.seg', 'ab'), open(base_path + '.idx', 'ab'), timestamp,
+                   os.path.getsize(base_path + '.seg'))
+        self.open_segments[stream_id] = segment
+        
+        for _, expired_path in self.list_segments(stream_id)[:-self.max_segments]:
+            for extension in ('.seg', '.idx'):
+                try:
+                    os.remove(expired_path + extension)
+                except FileNotFoundError:
+                    pass
+        return segment
+
+    def stats(self):
+        return {
+            "frames_recorded": self.frames_recorded,
+            "frames_dropped": self.frames_dropped,
+            "queue_depth": self.queue.qsize(),
+            "open_segments": len(self.open_segments)
+        }
+
+class ReplaySession:
+    def __init__(self, recorder, mailbox, stream_id, start=0.0, speed=1.0):
+        self.recorder = recorder
+        self.mailbox = mailbox
+        self.stream_id = stream_id
+        self.start = start
+        self.speed = speed
+        self.seek_to = None
+        self.position = None
+        self.frames_sent = 0
+        self.task = None
+
+    def begin(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+
+    def seek(self, timestamp):
+        self.seek_to = timestamp
+
+    async def run(self):
+        try:
+            position = self.start
+            while position is not None:
+                position = await self.play_from(position)
+            self.mailbox.push_control(json.dumps({
+                "type": "replay_finished",
+                "stream_id": self.stream_id,
+                "frames_sent": self.frames_sent
+            }))
+        except Exception as e:
+            logger.error(f"Replay error for stream {self.stream_id}: {e}")
+
+    async def play_from(self, position):
+        loop = asyncio.get_running_loop()
+        segments = await loop.run_in_executor(None, self.recorder.list_segments, self.stream_id)
+        first = max(0, bisect.bisect_right([started for started, _ in segments], position) - 1)
+        anchor = None
+        
+        for _, base_path in segments[first:]:
+            try:
+                data, entries = await loop.run_in_executor(None, self.load_segment, base_path, position)
+            except OSError as e:
+                logger.warning(f"Skipping segment {base_path}: {e}")
+                continue
+            if data is None:
+                continue
+            try:
+                for timestamp, offset, length in entries:
+                    if self.seek_to is not None:
+                        position, self.seek_to = self.seek_to, None
+                        return position
+                    
+                    if anchor is None:
+                        anchor = (loop.time(), timestamp)
+                    elif self.speed > 0:
+                        delay = anchor[0] + (timestamp - anchor[1]) / self.speed - loop.time()
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                    
+                    await self.mailbox.wait_for_space()
+                    message = await loop.run_in_executor(None, self.read_frame, data, offset, length,
+                                                         self.mailbox.protocol)
+                    self.mailbox.push_frame(PreparedFrame(message))
+                    self.frames_sent += 1
+                    self.position = timestamp
+            finally:
+                data.close()
+        return None
+
+    def load_segment(self, base_path, position):
+        entries = self.recorder.read_index(base_path)
+        if not entries or os.path.getsize(base_path + '.seg') == 0:
+            return None, []
+        with open(base_path + '.seg', 'rb') as file:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(data, 'madvise'):
+            data.madvise(mmap.MADV_WILLNEED)
+        
+        start = bisect.bisect_left([entry[0] for entry in entries], position)
+        playable = []
+        for entry in entries[start:]:
+            if entry[1] + entry[2] > len(data):
+                break
+            playable.append(entry)
+        return data, playable
+
+    @staticmethod
+    def read_frame(data, offset, length, protocol):
+        message = data[offset:offset + length]
+        if protocol == JSON_PROTOCOL:
+            message = binary_frame_to_json(message)
+        return message
+
+    def stats(self):
+        return {
+            "stream_id": self.stream_id,
+            "speed": self.speed,
+            "position": self.position,
+            "frames_sent": self.frames_sent
+        }
+
+class Producer:
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.name = f"{websocket.remote_address[0]}:{websocket.remote_address[1]}"
+        self.protocol = JSON_PROTOCOL
+        self.stream_ids = []
+        self.announced_streams = False
+        self.frames_received = 0
+        self.requests = {}
+
+    def frame_stream_id(self, binary_message=None, json_message=None):
+        if len(self.stream_ids) == 1:
+            return self.stream_ids[0]
+        if binary_message is not None:
+            return binary_frame_stream_id(binary_message)
+        return json_frame_stream_id(json_message)
+
+    def track_request(self, request_id, command, mailbox, client_request_id):
+        self.requests[request_id] = (command, mailbox, client_request_id)
+        while len(self.requests) > MAX_PENDING_REQUESTS:
+            del self.requests[next(iter(self.requests))]
+
+    def take_request(self, command, request_id=None):
+        if request_id not in self.requests:
+            request_id = next((pending_id for pending_id, (pending, _, _) in self.requests.items()
+                               if pending == command), None)
+        if request_id is None:
+            return None
+        return self.requests.pop(request_id)
+
+    async def send_command(self, command, stream_id, **fields):
+        message = {
+            "type": "command",
+            "command": command,
+            "from": "mobile_client",
+            **fields
+        }
+        if self.announced_streams:
+            message["stream_id"] = stream_id
+        try:
+            await self.websocket.send(json.dumps(message))
+            logger.info(f"Sent {command} for stream {stream_id} to Raspberry Pi {self.name}")
+        except websockets.exceptions.ConnectionClosed:
+            logger.warning(f"Raspberry Pi {self.name} closed before {command} for stream {stream_id}")
+
 class StreamManager:
     def __init__(self):
         self.connected_clients = set()
-        self.raspberry_connection = None
+        self.mailboxes = {}
+        self.mailbox_size = 2
+        self.producers = {}
+        self.streams = {}
+        self.subscriptions = {}
+        self.frame_cache = FrameCache()
+        self.composites = {}
+        self.flatten_pending = set()
+        self.recorder = None
+        self.replays = {}
+        self.renditions = {}
+        self.rendition_pool = None
+        self.rendition_workers = 0
+        self.renditions_pending = {}
+        self.renditions_rendered = 0
+        self.renditions_skipped = 0
+        self.status_ttl = 1.0
+        self.request_counter = 0
+        self.status_cache = None
+        self.log_events = LogAggregator(title="Relay")
         
     async def handle_raspberry_pi(self, websocket):
         client_ip = websocket.remote_address[0]
         logger.info(f"Raspberry Pi connected from {client_ip}")
-        self.raspberry_connection = websocket
+        producer = Producer(websocket)
+        self.producers[websocket] = producer
+        self.status_cache = None
         
         try:
             await websocket.send(json.dumps({
@@ -27,121 +749,558 @@ class StreamManager:
                 "message": "Raspberry Pi connected successfully"
             }))
             logger.info("Sent connection confirmation to Raspberry Pi")
+            await self.register_streams(producer, [producer.name])
             
             async for message in websocket:
                 try:
+                    if isinstance(message, bytes):
+                        if message.startswith(BINARY_FRAME_PREFIX) or message.startswith(BINARY_DELTA_PREFIX):
+                            self.forward_frame(producer, binary_message=message)
+                        else:
+                            logger.warning(f"Unknown binary message from Raspberry Pi: {message[:4]!r}")
+                        continue
+                    
+                    if message.startswith(JSON_FRAME_PREFIX):
+                        self.forward_frame(producer, json_message=message)
+                        continue
+                    
                     data = json.loads(message)
                     message_type = data.get("type")
                     
                     logger.info(f"Received from Raspberry Pi: {message_type}")
                     
                     if message_type == "video_frame":
-                        if self.connected_clients:
-                            clients_count = len(self.connected_clients)
-                            await asyncio.gather(
-                                *[client.send(message) for client in self.connected_clients],
-                                return_exceptions=True
-                            )
-                            logger.info(f"Frame forwarded to {clients_count} mobile clients")
-                        else:
-                            logger.warning("No mobile clients to forward frame to")
+                        self.forward_frame(producer, json_message=message)
+                    
+                    elif message_type == "hello":
+                        offered = data.get("protocols", [JSON_PROTOCOL])
+                        producer.protocol = next(
+                            (protocol for protocol in SUPPORTED_PROTOCOLS if protocol in offered), JSON_PROTOCOL)
+                        await websocket.send(json.dumps({
+                            "type": "protocol",
+                            "protocol": producer.protocol,
+                            "features": list(RELAY_FEATURES)
+                        }))
+                        logger.info(f"Raspberry Pi frame protocol: {producer.protocol}")
+                        producer.announced_streams = "streams" in data
+                        await self.announce_streams(producer, data.get("streams") or [producer.name])
                     
                     elif message_type == "command":
                         command = data.get("command")
                         logger.info(f"Command from Raspberry Pi: {command}")
                         
+                    elif message_type in PRODUCER_QUERIES.values():
+                        command = next(name for name, reply in PRODUCER_QUERIES.items() if reply == message_type)
+                        self.route_reply(producer, command, data)
+                    
                     elif message_type == "ack":
                         logger.info(f"ACK from Raspberry Pi: {data}")
+                        if data.get("command") in TUNING_COMMANDS:
+                            self.route_reply(producer, data["command"], data)
                         
                 except json.JSONDecodeError as e:
                     logger.error(f"Invalid JSON from Raspberry Pi: {e}")
-                    logger.error(f"Raw message: {message}")
+                    logger.error(f"Raw message: {message[:100]}")
+                except (ValueError, KeyError, struct.error) as e:
+                    logger.error(f"Invalid video frame from Raspberry Pi: {e}")
                     
         except websockets.exceptions.ConnectionClosed as e:
             logger.info(f"Raspberry Pi disconnected: {e}")
         except Exception as e:
             logger.error(f"Error with Raspberry Pi: {e}")
         finally:
-            self.raspberry_connection = None
-            logger.info("Raspberry Pi connection cleaned up")
+            self.unregister_producer(producer)
+            logger.info(f"Raspberry Pi connection cleaned up. Streams released: {producer.stream_ids}")
+
+    async def forward_request(self, mailbox, command, data):
+        stream_id = data.get("stream_id")
+        if stream_id is None:
+            producers = set(self.streams.values())
+        else:
+            producers = {self.streams[stream_id]} if stream_id in self.streams else set()
+        if not producers:
+            mailbox.push_control(json.dumps({
+                "type": "error",
+                "message": f"Stream not available: {stream_id}" if stream_id else "Raspberry Pi not connected"
+            }))
+            return
+        
+        fields = {key: data[key] for key in REQUEST_FIELDS if key in data}
+        for producer in producers:
+            self.request_counter += 1
+            producer.track_request(self.request_counter, command, mailbox, data.get("request_id"))
+            await producer.send_command(command, stream_id, request_id=self.request_counter, **fields)
+        mailbox.push_control(json.dumps({
+            "type": "ack",
+            "command": command,
+            "status": "sent",
+            "producers": len(producers),
+            "message": "Command sent to Raspberry Pi"
+        }))
+
+    def route_reply(self, producer, command, data):
+        request = producer.take_request(command, data.get("request_id"))
+        if request is None:
+            logger.warning(f"Unsolicited {command} reply from Raspberry Pi {producer.name}")
+            return
+        _, mailbox, client_request_id = request
+        if self.mailboxes.get(mailbox.websocket) is not mailbox:
+            return
+        data.pop("request_id", None)
+        if client_request_id is not None:
+            data["request_id"] = client_request_id
+        data["producer"] = producer.name
+        mailbox.push_control(json.dumps(data))
+
+    async def register_streams(self, producer, stream_ids):
+        for stream_id in stream_ids:
+            owner = self.streams.get(stream_id)
+            if owner is not None and owner is not producer:
+                logger.warning(f"Stream {stream_id} from {producer.name} is already served by {owner.name}")
+                await producer.websocket.send(json.dumps({
+                    "type": "error",
+                    "message": f"Stream id already registered: {stream_id}"
+                }))
+                continue
+            if stream_id not in producer.stream_ids:
+                producer.stream_ids.append(stream_id)
+            self.streams[stream_id] = producer
+            self.status_cache = None
+            
+            for mailbox in self.mailboxes.values():
+                if mailbox.subscribe_all:
+                    self.subscribe(mailbox, stream_id)
+            if self.subscriptions.get(stream_id):
+                await producer.send_command("start_stream", stream_id)
+        logger.info(f"Raspberry Pi {producer.name} serves streams: {producer.stream_ids}")
+
+    async def announce_streams(self, producer, stream_ids):
+        released = [stream_id for stream_id in producer.stream_ids if stream_id not in stream_ids]
+        started = any(self.subscriptions.get(stream_id) for stream_id in released)
+        for stream_id in released:
+            producer.stream_ids.remove(stream_id)
+            if self.streams.get(stream_id) is producer:
+                del self.streams[stream_id]
+                self.composites.pop(stream_id, None)
+            for mailbox in self.subscriptions.pop(stream_id, ()):
+                mailbox.subscriptions.discard(stream_id)
+                mailbox.synced.discard(stream_id)
+        self.status_cache = None
+        
+        await self.register_streams(producer, stream_ids)
+        if started:
+            for stream_id in producer.stream_ids:
+                if not self.subscriptions.get(stream_id):
+                    await producer.send_command("stop_stream", stream_id)
+
+    def unregister_producer(self, producer):
+        self.producers.pop(producer.websocket, None)
+        self.status_cache = None
+        for stream_id in producer.stream_ids:
+            if self.streams.get(stream_id) is producer:
+                del self.streams[stream_id]
+                self.composites.pop(stream_id, None)
+
+    def subscribe(self, mailbox, stream_id):
+        subscribers = self.subscriptions.setdefault(stream_id, set())
+        if mailbox in subscribers:
+            return
+        subscribers.add(mailbox)
+        mailbox.subscriptions.add(stream_id)
+        self.status_cache = None
+        
+        composite = self.composites.get(stream_id)
+        if composite is not None and composite.latest is not None:
+            if mailbox.delta and mailbox.tier == SOURCE_TIER:
+                mailbox.push_frame(composite.sync().prepared_for(mailbox.protocol))
+                mailbox.synced.add(stream_id)
+            else:
+                self.schedule_flatten(composite)
+            return
+        
+        cached = self.frame_cache.get(stream_id)
+        if cached is not None:
+            mailbox.push_frame(cached.prepared_for(mailbox.protocol))
+
+    async def unsubscribe(self, mailbox, stream_id):
+        subscribers = self.subscriptions.get(stream_id)
+        mailbox.subscriptions.discard(stream_id)
+        if subscribers is None or mailbox not in subscribers:
+            return
+        subscribers.discard(mailbox)
+        mailbox.synced.discard(stream_id)
+        self.status_cache = None
+        if not subscribers:
+            del self.subscriptions[stream_id]
+            producer = self.streams.get(stream_id)
+            if producer is not None:
+                logger.info(f"No subscribers left for stream {stream_id}, pausing it")
+                await producer.send_command("stop_stream", stream_id)
+
+    def forward_frame(self, producer, binary_message=None, json_message=None):
+        producer.frames_received += 1
+        stream_id = producer.frame_stream_id(binary_message, json_message)
+        if self.streams.get(stream_id) is not producer:
+            logger.warning(f"Frame for unregistered stream {stream_id} from {producer.name}")
+            return
+        
+        if binary_message is not None and (binary_message[3] == FRAME_TYPE_DELTA or is_keyframe(binary_message)):
+            self.forward_delta_frame(producer, stream_id, binary_message)
+            return
+        self.composites.pop(stream_id, None)
+        
+        frame = CachedFrame(binary_message, json_message, stream_id)
+        self.frame_cache.put(stream_id, frame)
+        self.deliver_frame(stream_id, frame, binary_message, json_message)
+
+    def deliver_frame(self, stream_id, frame, binary_message=None, json_message=None, skip_delta=False):
+        if self.recorder is not None:
+            self.recorder.record(stream_id, binary_message, json_message)
+        
+        subscribers = self.subscriptions.get(stream_id)
+        if not subscribers:
+            self.log_events.count(f"{stream_id} unwatched frames")
+            return
+        
+        tiers = {}
+        deliveries = 0
+        for mailbox in subscribers:
+            if mailbox.tier in self.renditions:
+                tiers.setdefault(mailbox.tier, []).append(mailbox)
+            elif not (skip_delta and mailbox.delta):
+                mailbox.push_frame(frame.prepared_for(mailbox.protocol))
+                deliveries += 1
+        if tiers:
+            self.schedule_renditions(stream_id, frame, tiers)
+        
+        self.log_events.count(f"{stream_id} frames")
+        self.log_events.count(f"{stream_id} deliveries", deliveries + sum(map(len, tiers.values())))
 
-    async def handle_mobile_client(self, websocket):
+    def forward_delta_frame(self, producer, stream_id, binary_message):
+        delta = binary_message[3] == FRAME_TYPE_DELTA
+        composite = self.composites.get(stream_id)
+        if composite is None:
+            composite = self.composites[stream_id] = DeltaComposite(stream_id)
+        if not composite.apply(binary_message, delta):
+            if not composite.keyframe_requested:
+                composite.keyframe_requested = True
+                logger.info(f"Delta for stream {stream_id} without its keyframe, requesting one")
+                asyncio.create_task(producer.send_command("request_keyframe", stream_id))
+            return
+        
+        if not delta:
+            frame = CachedFrame(binary_message, stream_id=stream_id)
+            self.frame_cache.put(stream_id, frame)
+            for mailbox in self.subscriptions.get(stream_id, ()):
+                if mailbox.delta:
+                    mailbox.synced.add(stream_id)
+            self.deliver_frame(stream_id, frame, binary_message)
+            return
+        
+        frame = CachedFrame(binary_message, stream_id=stream_id, delta=True)
+        needs_flat = self.recorder is not None
+        for mailbox in self.subscriptions.get(stream_id, ()):
+            if not mailbox.delta or mailbox.tier in self.renditions:
+                needs_flat = True
+            elif stream_id in mailbox.synced:
+                mailbox.push_frame(frame.prepared_for(mailbox.protocol))
+            else:
+                mailbox.push_frame(composite.sync().prepared_for(mailbox.protocol))
+                mailbox.synced.add(stream_id)
+        if needs_flat:
+            self.schedule_flatten(composite)
+        self.log_events.count(f"{stream_id} delta frames")
+
+    def schedule_flatten(self, composite):
+        if composite.stream_id in self.flatten_pending:
+            return
+        self.flatten_pending.add(composite.stream_id)
+        asyncio.create_task(self.forward_flattened(composite))
+
+    async def forward_flattened(self, composite):
+        stream_id = composite.stream_id
+        try:
+            latest = composite.latest
+            metadata = composite.metadata()
+            metadata.pop("keyframe_id", None)
+            keyframe_jpeg, tiles = composite.take_changes()
+            
+            loop = asyncio.get_running_loop()
+            composite.canvas, jpeg_bytes = await loop.run_in_executor(
+                None, composite_tiles, composite.canvas, keyframe_jpeg, tiles, metadata.get("jpeg_quality") or 80)
+            
+            binary_message = pack_binary_frame(latest["frame_id"], latest["timestamp"],
+                                               latest["encode_timestamp"], metadata, jpeg_bytes)
+            frame = CachedFrame(binary_message, stream_id=stream_id)
+            self.frame_cache.put(stream_id, frame)
+            if self.composites.get(stream_id) is composite:
+                self.deliver_frame(stream_id, frame, binary_message, skip_delta=True)
+        except Exception as e:
+            logger.error(f"Delta composite error for stream {stream_id}: {e}")
+        finally:
+            self.flatten_pending.discard(stream_id)
+
+    def schedule_renditions(self, stream_id, frame, tiers):
+        pending = self.renditions_pending.get(stream_id, 0)
+        if pending >= self.rendition_workers:
+            self.renditions_skipped += 1
+            return
+        self.renditions_pending[stream_id] = pending + 1
+        asyncio.create_task(self.forward_renditions(stream_id, frame, tiers))
+
+    async def forward_renditions(self, stream_id, frame, tiers):
+        try:
+            binary_message = frame.binary_message
+            if binary_message is None:
+                binary_message = json_frame_to_binary(json.loads(frame.json_message))
+            source = unpack_binary_frame(binary_message)
+            settings = [(self.renditions[tier].get("scale", 1.0), self.renditions[tier].get("quality", 70))
+                        for tier in tiers]
+            
+            loop = asyncio.get_running_loop()
+            results = await loop.run_in_executor(self.rendition_pool, render_renditions,
+                                                 bytes(source["jpeg"]), settings)
+            
+            for (tier, mailboxes), (jpeg_bytes, width, height), (_, quality) in zip(tiers.items(), results, settings):
+                metadata = dict(source["metadata"])
+                source_width, source_height = metadata.get("resolution") or (width, height)
+                metadata["detections"] = scale_detections(metadata.get("detections", []),
+                                                          width / source_width, height / source_height)
+                metadata.update(resolution=[width, height], jpeg_quality=quality, tier=tier)
+                rendition = CachedFrame(pack_binary_frame(source["frame_id"], source["timestamp"],
+                                                          source["encode_timestamp"], metadata, jpeg_bytes))
+                for mailbox in mailboxes:
+                    if mailbox.tier == tier and mailbox.websocket in self.mailboxes:
+                        mailbox.push_frame(rendition.prepared_for(mailbox.protocol))
+            self.renditions_rendered += len(tiers)
+        except Exception as e:
+            logger.error(f"Rendition error for stream {stream_id}: {e}")
+        finally:
+            self.renditions_pending[stream_id] -= 1
+
+    def client_stats(self):
+        return [mailbox.stats() for mailbox in self.mailboxes.values()]
+
+    def stream_stats(self):
+        return {
+            stream_id: {
+                "producer": producer.name,
+                "subscribers": len(self.subscriptions.get(stream_id, ())),
+                "delta": self.composites[stream_id].stats() if stream_id in self.composites else None
+            }
+            for stream_id, producer in self.streams.items()
+        }
+
+    def status_message(self):
+        now = time.monotonic()
+        if self.status_cache is None or now - self.status_cache[0] > self.status_ttl:
+            status_info = {
+                "type": "status",
+                "raspberry_connected": bool(self.streams),
+                "producers_count": len(self.producers),
+                "streams": self.stream_stats(),
+                "cached_frames": self.frame_cache.stats(),
+                "recording": self.recorder.stats() if self.recorder is not None else None,
+                "replays": [replay.stats() for replay in self.replays.values()],
+                "renditions": {
+                    "tiers": [SOURCE_TIER] + list(self.renditions),
+                    "rendered": self.renditions_rendered,
+                    "skipped": self.renditions_skipped
+                },
+                "clients_count": len(self.connected_clients),
+                "clients": self.client_stats(),
+                "timestamp": datetime.now().isoformat()
+            }
+            self.status_cache = (now, json.dumps(status_info))
+        return self.status_cache[1]
+
+    async def handle_mobile_client(self, websocket, tier=None):
         client_ip = websocket.remote_address[0]
         logger.info(f"Mobile client connected from {client_ip}")
+        mailbox = ClientMailbox(websocket, self.mailbox_size)
+        if tier in self.renditions:
+            mailbox.tier = tier
+        mailbox.start()
         self.connected_clients.add(websocket)
+        self.mailboxes[websocket] = mailbox
+        self.status_cache = None
         
         try:
-            await websocket.send(json.dumps({
+            mailbox.push_control(json.dumps({
                 "type": "connection",
                 "status": "connected",
                 "message": "Connected to video stream server",
-                "raspberry_connected": self.raspberry_connection is not None
+                "raspberry_connected": bool(self.streams),
+                "streams": list(self.streams),
+                "protocols": list(SUPPORTED_PROTOCOLS),
+                "tiers": [SOURCE_TIER] + list(self.renditions),
+                "tier": mailbox.tier
             }))
-            logger.info("Sent connection confirmation to mobile client")
+            mailbox.push_control(self.status_message())
+            logger.info("Sent connection confirmation and status to mobile client")
             
             async for message in websocket:
                 try:
                     data = json.loads(message)
                     command = data.get("command")
+                    stream_id = data.get("stream_id")
                     
                     logger.info(f"Command from mobile: {command}")
                     
-                    if command == "start_stream":
-                        if self.raspberry_connection:
-                            await self.raspberry_connection.send(json.dumps({
-                                "type": "command",
-                                "command": "start_stream",
-                                "from": "mobile_client"
+                    if command == "set_protocol":
+                        protocol = data.get("protocol", JSON_PROTOCOL)
+                        if protocol in SUPPORTED_PROTOCOLS:
+                            mailbox.protocol = protocol
+                            mailbox.delta = bool(data.get("delta", False))
+                            mailbox.synced.clear()
+                            mailbox.push_control(json.dumps({
+                                "type": "ack",
+                                "command": "set_protocol",
+                                "status": "success",
+                                "protocol": protocol,
+                                "delta": mailbox.delta,
+                                "message": f"Frame protocol set to {protocol}"
+                            }))
+                        else:
+                            mailbox.push_control(json.dumps({
+                                "type": "error",
+                                "message": f"Unsupported protocol: {protocol}"
+                            }))
+                    
+                    elif command == "set_tier":
+                        tier = data.get("tier", SOURCE_TIER)
+                        if tier == SOURCE_TIER or tier in self.renditions:
+                            mailbox.tier = tier
+                            mailbox.synced.clear()
+                            mailbox.push_control(json.dumps({
+                                "type": "ack",
+                                "command": "set_tier",
+                                "status": "success",
+                                "tier": tier,
+                                "message": f"Rendition tier set to {tier}"
+                            }))
+                        else:
+                            mailbox.push_control(json.dumps({
+                                "type": "error",
+                                "message": f"Unknown rendition tier: {tier}"
                             }))
-                            logger.info("Sent start_stream to Raspberry Pi")
+                    
+                    elif command == "start_stream":
+                        if stream_id is None:
+                            stream_ids = list(self.streams)
+                        else:
+                            stream_ids = [stream_id] if stream_id in self.streams else []
+                        
+                        if stream_ids:
+                            if stream_id is None:
+                                mailbox.subscribe_all = True
+                            for subscribed_id in stream_ids:
+                                self.subscribe(mailbox, subscribed_id)
+                                await self.streams[subscribed_id].send_command("start_stream", subscribed_id)
                             
-                            await websocket.send(json.dumps({
+                            mailbox.push_control(json.dumps({
                                 "type": "ack",
                                 "command": "start_stream",
                                 "status": "success",
+                                "streams": stream_ids,
                                 "message": "Command sent to Raspberry Pi"
                             }))
-                        else:
+                        elif stream_id is None:
                             logger.warning("No Raspberry Pi connected")
-                            await websocket.send(json.dumps({
+                            mailbox.push_control(json.dumps({
                                 "type": "error",
                                 "message": "Raspberry Pi not connected"
                             }))
+                        else:
+                            logger.warning(f"Stream {stream_id} is not available")
+                            mailbox.push_control(json.dumps({
+                                "type": "error",
+                                "message": f"Stream not available: {stream_id}"
+                            }))
                             
                     elif command == "stop_stream":
-                        if self.raspberry_connection:
-                            await self.raspberry_connection.send(json.dumps({
-                                "type": "command", 
-                                "command": "stop_stream",
-                                "from": "mobile_client"
-                            }))
-                            logger.info("Sent stop_stream to Raspberry Pi")
+                        if stream_id is None:
+                            mailbox.subscribe_all = False
+                            stream_ids = list(mailbox.subscriptions)
+                        else:
+                            stream_ids = [stream_id]
+                        for unsubscribed_id in stream_ids:
+                            await self.unsubscribe(mailbox, unsubscribed_id)
+                        
+                        mailbox.push_control(json.dumps({
+                            "type": "ack",
+                            "command": "stop_stream", 
+                            "status": "success",
+                            "streams": stream_ids,
+                            "message": "Unsubscribed from stream"
+                        }))
                             
-                            await websocket.send(json.dumps({
+                    elif command in PRODUCER_QUERIES or command in TUNING_COMMANDS:
+                        await self.forward_request(mailbox, command, data)
+                    
+                    elif command == "replay":
+                        if self.recorder is None:
+                            mailbox.push_control(json.dumps({
+                                "type": "error",
+                                "message": "Recording is disabled"
+                            }))
+                        elif not await asyncio.get_running_loop().run_in_executor(
+                                None, self.recorder.list_segments, stream_id or ""):
+                            mailbox.push_control(json.dumps({
+                                "type": "error",
+                                "message": f"No recording for stream: {stream_id}"
+                            }))
+                        else:
+                            previous = self.replays.pop(websocket, None)
+                            if previous is not None:
+                                await previous.stop()
+                            replay = ReplaySession(self.recorder, mailbox, stream_id,
+                                                   float(data.get("from", 0.0)), float(data.get("speed", 1.0)))
+                            self.replays[websocket] = replay
+                            replay.begin()
+                            mailbox.push_control(json.dumps({
                                 "type": "ack",
-                                "command": "stop_stream", 
+                                "command": "replay",
                                 "status": "success",
-                                "message": "Command sent to Raspberry Pi"
+                                "stream_id": stream_id,
+                                "message": f"Replaying {stream_id} at {replay.speed}x"
                             }))
-                        else:
-                            await websocket.send(json.dumps({
+                    
+                    elif command == "seek":
+                        replay = self.replays.get(websocket)
+                        if replay is None or replay.task.done():
+                            mailbox.push_control(json.dumps({
                                 "type": "error",
-                                "message": "Raspberry Pi not connected"
+                                "message": "No replay in progress"
                             }))
-                            
+                        else:
+                            replay.seek(float(data.get("timestamp", 0.0)))
+                            mailbox.push_control(json.dumps({
+                                "type": "ack",
+                                "command": "seek",
+                                "status": "success",
+                                "message": f"Seeking to {data.get('timestamp', 0.0)}"
+                            }))
+                    
+                    elif command == "stop_replay":
+                        replay = self.replays.pop(websocket, None)
+                        if replay is not None:
+                            await replay.stop()
+                        mailbox.push_control(json.dumps({
+                            "type": "ack",
+                            "command": "stop_replay",
+                            "status": "success",
+                            "message": "Replay stopped"
+                        }))
+                    
                     elif command == "status":
-                        status_info = {
-                            "type": "status",
-                            "raspberry_connected": self.raspberry_connection is not None,
-                            "clients_count": len(self.connected_clients),
-                            "timestamp": datetime.now().isoformat()
-                        }
-                        await websocket.send(json.dumps(status_info))
-                        logger.info(f"Status sent: {status_info}")
+                        status_message = self.status_message()
+                        mailbox.push_control(status_message)
+                        logger.info(f"Status sent: {status_message}")
                         
                 except json.JSONDecodeError as e:
                     logger.error(f"Invalid JSON from mobile: {e}")
-                    await websocket.send(json.dumps({
+                    mailbox.push_control(json.dumps({
                         "type": "error",
                         "message": "Invalid JSON format"
                     }))
@@ -152,6 +1311,14 @@ class StreamManager:
             logger.error(f"Error with mobile client: {e}")
         finally:
             self.connected_clients.discard(websocket)
+            self.mailboxes.pop(websocket, None)
+            self.status_cache = None
+            for stream_id in list(mailbox.subscriptions):
+                await self.unsubscribe(mailbox, stream_id)
+            replay = self.replays.pop(websocket, None)
+            if replay is not None:
+                await replay.stop()
+            await mailbox.stop()
             logger.info(f"Mobile client removed. Total: {len(self.connected_clients)}")
 
 stream_manager = StreamManager()
@@ -161,23 +1328,68 @@ async def handler(websocket):
     path = websocket.path if hasattr(websocket, 'path') else "/"
     
     logger.info(f"New connection from {client_ip}, path: '{path}'")
+    path, _, query = path.partition('?')
     
     if path == "/raspberry":
         logger.info("Routing to Raspberry Pi handler")
         await stream_manager.handle_raspberry_pi(websocket)
     else:
         logger.info("Routing to mobile client handler")
-        await stream_manager.handle_mobile_client(websocket)
+        tier = parse_qs(query).get("tier", [None])[0]
+        await stream_manager.handle_mobile_client(websocket, tier)
 
 async def health_check():
     while True:
-        logger.info(f"Health check - Raspberry: {stream_manager.raspberry_connection is not None}, Mobile clients: {len(stream_manager.connected_clients)}")
+        logger.info(f"Health check - Raspberry Pis: {len(stream_manager.producers)}, "
+                    f"Streams: {len(stream_manager.streams)}, Mobile clients: {len(stream_manager.connected_clients)}")
+        for stream_id, stats in stream_manager.stream_stats().items():
+            logger.info(f"Stream {stream_id} from {stats['producer']}: {stats['subscribers']} subscribers")
+        stream_manager.log_events.flush()
+        for stats in stream_manager.client_stats():
+            if stats["frames_dropped"]:
+                logger.info(f"Client {stats['address']}: sent {stats['frames_sent']}, dropped {stats['frames_dropped']}, "
+                            f"queue depth {stats['queue_depth']}")
         await asyncio.sleep(30)
 
-async def main():
-    with open('config.json','r') as f:
+async def main(config_path='config.json', port=None):
+    with open(config_path,'r') as f:
         server_info = json.loads(f.read())
-    server = await websockets.serve(handler, "0.0.0.0", server_info['ACCESS-PORT'])
+    if port is not None:
+        server_info['ACCESS-PORT'] = port
+    
+    log_handlers = [logging.StreamHandler()]
+    if server_info.get('LOG-FILE'):
+        log_handlers.append(logging.FileHandler(server_info['LOG-FILE'], encoding='utf-8'))
+    for log_handler in log_handlers:
+        log_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    start_log_listener(log_handlers, server_info.get('LOG-RATE-LIMIT', 5.0))
+    stream_manager.log_events.interval = server_info.get('LOG-SUMMARY-INTERVAL', 10.0)
+    
+    stream_manager.mailbox_size = server_info.get('MAILBOX-SIZE', 2)
+    stream_manager.frame_cache.max_streams = server_info.get('FRAME-CACHE-SIZE', 16)
+    stream_manager.status_ttl = server_info.get('STATUS-CACHE-TTL', 1.0)
+    if server_info.get('RECORDING-ENABLED', False):
+        stream_manager.recorder = SegmentRecorder(server_info.get('RECORDING-DIR', 'recordings'),
+                                                  server_info.get('RECORDING-SEGMENT-SECONDS', 60),
+                                                  server_info.get('RECORDING-MAX-SEGMENTS', 60),
+                                                  server_info.get('RECORDING-QUEUE-SIZE', 256))
+        stream_manager.recorder.start()
+    if server_info.get('RENDITIONS'):
+        try:
+            import cv2
+            stream_manager.renditions = server_info['RENDITIONS']
+            stream_manager.rendition_workers = server_info.get('RENDITION-WORKERS', 2)
+            context = multiprocessing.get_context('forkserver')
+            context.set_forkserver_preload(['cv2', 'numpy'])
+            stream_manager.rendition_pool = ProcessPoolExecutor(max_workers=stream_manager.rendition_workers,
+                                                                mp_context=context)
+            for _ in range(stream_manager.rendition_workers):
+                stream_manager.rendition_pool.submit(int)
+            logger.info(f"Rendition tiers: {', '.join(stream_manager.renditions)}")
+        except ImportError:
+            logger.error("RENDITIONS require opencv-python, renditions are disabled")
+    server = await websockets.serve(handler, "0.0.0.0", server_info['ACCESS-PORT'],
+                                    compression=server_info.get('COMPRESSION'))
     logger.info(f"WebSocket server running on ws://0.0.0.0:{server_info['ACCESS-PORT']}")
     logger.info("Available paths:")
     logger.info("  - /raspberry - для Raspberry Pi")
@@ -185,10 +1397,25 @@ async def main():
     
     asyncio.create_task(health_check())
     
-    await asyncio.Future()
+    stopped = asyncio.get_running_loop().create_future()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stopped.set_result, None)
+    try:
+        await stopped
+        logger.info("Server stopped by SIGTERM")
+    finally:
+        if stream_manager.recorder is not None:
+            stream_manager.recorder.stop()
+        if stream_manager.rendition_pool is not None:
+            stream_manager.rendition_pool.shutdown(cancel_futures=True)
+        stream_manager.log_events.flush()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Video stream relay server')
+    parser.add_argument('--config', default='config.json', help='Path to config file')
+    parser.add_argument('--port', type=int, help='Override ACCESS-PORT')
+    args = parser.parse_args()
+    
     try:
-        asyncio.run(main())
+        asyncio.run(main(args.config, args.port))
     except KeyboardInterrupt:
         logger.info("Server stopped by user")
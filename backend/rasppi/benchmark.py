@@ -0,0 +1,221 @@
+import os
+import sys
+import json
+import argparse
+import asyncio
+import websockets
+import numpy as np
+import logging
+import time
+import resource
+import subprocess
+import tempfile
+from datetime import datetime
+
+from rasppi import RobustYOLOStreamer
+
+STAGES = ("capture", "frame_age", "motion_gate", "inference", "tracking", "postprocess", "draw", "encode", "send")
+
+class StageRecorder:
+
+    def __init__(self):
+        self.recording = False
+        self.samples = {stage: [] for stage in STAGES}
+
+    def __call__(self, stage, seconds):
+        if self.recording:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def summary(self):
+        result = {}
+        for stage, samples in self.samples.items():
+            if not samples:
+                continue
+            values = np.array(samples) * 1000
+            result[stage] = {
+                "count": len(values),
+                "mean_ms": round(float(values.mean()), 3),
+                "p50_ms": round(float(np.percentile(values, 50)), 3),
+                "p95_ms": round(float(np.percentile(values, 95)), 3),
+                "p99_ms": round(float(np.percentile(values, 99)), 3)
+            }
+        return result
+
+def build_source(args):
+    if args.source == "synthetic":
+        return {"type": "synthetic", "fps": args.source_fps}
+    if args.source.startswith('/dev/'):
+        return {"type": "v4l2", "fps": args.source_fps}
+    source_type = "images" if os.path.isdir(args.source) else "video"
+    return {"type": source_type, "path": os.path.abspath(args.source), "fps": args.source_fps}
+
+def build_config(base_path, args):
+    with open(base_path, 'r', encoding='utf-8') as file:
+        config = json.load(file)
+
+    overrides = {
+        ('model', 'path'): args.model,
+        ('model', 'backend'): args.backend,
+        ('stream', 'jpeg_quality'): args.jpeg_quality,
+        ('stream', 'pipeline'): args.pipeline,
+        ('stream', 'protocol'): args.protocol,
+        ('camera', 'width'): args.width,
+        ('camera', 'height'): args.height,
+        ('camera', 'passthrough'): args.passthrough,
+        ('camera', 'decode_scale'): args.decode_scale,
+        ('detection', 'burn_in'): args.burn_in
+    }
+    for (section, key), value in overrides.items():
+        if value is not None:
+            config.setdefault(section, {})[key] = value
+    config.setdefault('camera', {})['source'] = build_source(args)
+    if args.source.startswith('/dev/'):
+        config['camera']['device_options'] = [args.source]
+    config.setdefault('server', {})['url'] = f"ws://127.0.0.1:{args.port}/raspberry"
+    config['server']['max_reconnect_attempts'] = 1
+
+    handle, path = tempfile.mkstemp(prefix='benchmark_', suffix='.json')
+    with os.fdopen(handle, 'w', encoding='utf-8') as file:
+        json.dump(config, file)
+    return config, path
+
+def current_rss_kb():
+    try:
+        with open('/proc/self/status', 'r') as file:
+            for line in file:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def wait_for_port(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.close()
+            return True
+        except OSError:
+            await asyncio.sleep(0.1)
+    return False
+
+async def run_viewer(port, protocol, warmup, duration, recorder):
+    async with websockets.connect(f"ws://127.0.0.1:{port}/", max_size=None) as websocket:
+        await websocket.send(json.dumps({"command": "set_protocol", "protocol": protocol}))
+        await websocket.send(json.dumps({"command": "start_stream"}))
+
+        frames = 0
+        received_bytes = 0
+        started = time.monotonic()
+        measuring_since = None
+        while True:
+            now = time.monotonic()
+            if measuring_since is None and now - started >= warmup:
+                measuring_since = now
+                recorder.recording = True
+            if measuring_since is not None and now - measuring_since >= duration:
+                break
+            try:
+                message = await asyncio.wait_for(websocket.recv(), timeout=0.5)
+            except asyncio.TimeoutError:
+                continue
+            is_frame = isinstance(message, bytes) or message.startswith('{"type": "video_frame"')
+            if not is_frame and json.loads(message).get("type") == "error" and measuring_since is None:
+                await asyncio.sleep(0.2)
+                await websocket.send(json.dumps({"command": "start_stream"}))
+            if is_frame and measuring_since is not None:
+                frames += 1
+                received_bytes += len(message)
+
+        recorder.recording = False
+        elapsed = time.monotonic() - measuring_since
+        await websocket.send(json.dumps({"command": "stop_stream"}))
+        return frames, received_bytes, elapsed
+
+async def run_benchmark(args):
+    config, config_path = build_config(args.config, args)
+    relay = subprocess.Popen([sys.executable, 'start_server.py', '--port', str(args.port)],
+                             cwd=args.server_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not await wait_for_port(args.port):
+            raise RuntimeError(f"Локальный сервер не запустился на порту {args.port}")
+
+        streamer = RobustYOLOStreamer(config_path)
+        recorder = StageRecorder()
+        streamer.stage_observer = recorder
+        streamer_task = asyncio.create_task(streamer.run())
+
+        frames, received_bytes, elapsed = await run_viewer(args.port, config['stream'].get('protocol', 'binary_v1'),
+                                                           args.warmup, args.duration, recorder)
+
+        streamer.shutdown_requested = True
+        streamer.is_streaming = False
+        await asyncio.wait_for(streamer_task, timeout=15)
+
+        return {
+            "timestamp": datetime.now().isoformat(),
+            "revision": git_revision(),
+            "source": args.source,
+            "source_fps": args.source_fps,
+            "model": config['model'].get('path'),
+            "backend": config['model'].get('backend', 'ultralytics'),
+            "jpeg_quality": config['stream'].get('jpeg_quality'),
+            "pipeline": config['stream'].get('pipeline', False),
+            "passthrough_frames": streamer.metrics.counters.get("passthrough_frames", 0),
+            "protocol": config['stream'].get('protocol'),
+            "duration_s": round(elapsed, 3),
+            "frames_received": frames,
+            "sustained_fps": round(frames / elapsed, 2) if elapsed else 0.0,
+            "mean_frame_bytes": round(received_bytes / frames) if frames else 0,
+            "stages": recorder.summary(),
+            "rss_kb": current_rss_kb(),
+            "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "startup": streamer.timeline.as_dict()
+        }
+    finally:
+        relay.terminate()
+        relay.wait(timeout=5)
+        os.remove(config_path)
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline per-stage benchmark for the YOLO streamer')
+    parser.add_argument('--config', default='config.json', help='Base config file')
+    parser.add_argument('--source', default='synthetic',
+                        help='"synthetic", a video file, an image directory or a /dev/video* device')
+    parser.add_argument('--source-fps', type=float, default=30.0, help='Frame rate limit for the source, 0 = unlimited')
+    parser.add_argument('--duration', type=float, default=30.0, help='Measured seconds')
+    parser.add_argument('--warmup', type=float, default=5.0, help='Seconds to discard before measuring')
+    parser.add_argument('--output', default='benchmark.json', help='Where to write JSON results')
+    parser.add_argument('--model', help='Override model path')
+    parser.add_argument('--backend', choices=['ultralytics', 'ncnn'], help='Override model backend')
+    parser.add_argument('--jpeg-quality', type=int, help='Override stream.jpeg_quality')
+    parser.add_argument('--pipeline', type=lambda value: value.lower() == 'true', help='Override stream.pipeline')
+    parser.add_argument('--protocol', choices=['binary_v1', 'json'], help='Override stream.protocol')
+    parser.add_argument('--burn-in', type=lambda value: value.lower() == 'true', help='Override detection.burn_in')
+    parser.add_argument('--passthrough', type=lambda value: value.lower() == 'true', help='Override camera.passthrough')
+    parser.add_argument('--decode-scale', type=int, choices=[1, 2, 4, 8], help='Override camera.decode_scale')
+    parser.add_argument('--width', type=int, help='Synthetic frame width')
+    parser.add_argument('--height', type=int, help='Synthetic frame height')
+    parser.add_argument('--port', type=int, default=18765, help='Port for the local relay')
+    parser.add_argument('--server-dir', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'inter'),
+                        help='Directory containing start_server.py')
+
+    args = parser.parse_args()
+
+    results = asyncio.run(run_benchmark(args))
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(results, file, indent=2, ensure_ascii=False)
+    logging.info(f"Результаты сохранены в {args.output}")
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,6 @@
+import time
+PROCESS_STARTED = time.monotonic()
+
 import os
 import sys
 import json
@@ -8,19 +11,488 @@ import base64
 import cv2
 import numpy as np
 import logging
-import time
 import signal
+import socket
+import threading
+import struct
+import uuid
+import bisect
+import queue
+import atexit
+from collections import OrderedDict
+from logging.handlers import QueueHandler, QueueListener
 from datetime import datetime
-from ultralytics import YOLO
+
+FRAME_MAGIC = b'CV'
+FRAME_PROTOCOL_VERSION = 1
+FRAME_TYPE_VIDEO = 1
+FRAME_TYPE_DELTA = 2
+FRAME_HEADER = struct.Struct('!2sBBIddI')
+BINARY_PROTOCOL = "binary_v1"
+JSON_PROTOCOL = "json"
+
+def pack_binary_frame(frame_id, timestamp, encode_timestamp, metadata, jpeg_bytes):
+    metadata_bytes = json.dumps(metadata, separators=(',', ':')).encode('utf-8')
+    header = FRAME_HEADER.pack(FRAME_MAGIC, FRAME_PROTOCOL_VERSION, FRAME_TYPE_VIDEO,
+                               frame_id & 0xFFFFFFFF, timestamp, encode_timestamp, len(metadata_bytes))
+    return b''.join((header, metadata_bytes, jpeg_bytes))
+
+def pack_delta_frame(frame_id, timestamp, encode_timestamp, metadata, tiles):
+    metadata = dict(metadata, tiles=[[x, y, w, h, len(data)] for x, y, w, h, data in tiles])
+    metadata_bytes = json.dumps(metadata, separators=(',', ':')).encode('utf-8')
+    header = FRAME_HEADER.pack(FRAME_MAGIC, FRAME_PROTOCOL_VERSION, FRAME_TYPE_DELTA,
+                               frame_id & 0xFFFFFFFF, timestamp, encode_timestamp, len(metadata_bytes))
+    return b''.join([header, metadata_bytes] + [data for *_, data in tiles])
+
+def jpeg_dimensions(data):
+    index = 2
+    while index + 9 <= len(data):
+        if data[index] != 0xFF:
+            return None
+        marker = data[index + 1]
+        if marker == 0xFF:
+            index += 1
+            continue
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack_from('!HH', data, index + 5)
+            return width, height
+        index += 2 + struct.unpack_from('!H', data, index + 2)[0]
+    return None
+
+class Histogram:
+    BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.BUCKETS, self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return float('inf')
+
+class StreamerMetrics:
+    COUNTERS = ("frames_sent", "dropped_frames", "camera_errors", "reconnects", "bytes_sent", "send_timeouts",
+                "passthrough_frames")
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        self.started = time.time()
+
+    def observe(self, stage, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def increment(self, counter, value=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "uptime_s": round(time.time() - self.started, 1),
+                "counters": dict(self.counters),
+                "stages": {
+                    stage: {
+                        "count": histogram.count,
+                        "mean_ms": round(histogram.total / histogram.count * 1000, 3) if histogram.count else 0.0,
+                        "p50_ms": histogram.quantile(0.5) * 1000,
+                        "p95_ms": histogram.quantile(0.95) * 1000,
+                        "p99_ms": histogram.quantile(0.99) * 1000
+                    }
+                    for stage, histogram in self.histograms.items()
+                }
+            }
+
+    def render_prometheus(self, extra_gauges=None):
+        lines = []
+        with self.lock:
+            for name, value in self.counters.items():
+                lines.append(f"# TYPE yolo_streamer_{name}_total counter")
+                lines.append(f"yolo_streamer_{name}_total {value}")
+            lines.append("# TYPE yolo_streamer_stage_seconds histogram")
+            for stage, histogram in self.histograms.items():
+                cumulative = 0
+                for bound, count in zip(Histogram.BUCKETS, histogram.counts):
+                    cumulative += count
+                    lines.append(f'yolo_streamer_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'yolo_streamer_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'yolo_streamer_stage_seconds_sum{{stage="{stage}"}} {histogram.total}')
+                lines.append(f'yolo_streamer_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+        for name, value in (extra_gauges or {}).items():
+            lines.append(f"# TYPE yolo_streamer_{name} gauge")
+            lines.append(f"yolo_streamer_{name} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+DETECTION_RECORD = np.dtype([
+    ('timestamp', 'f8'),
+    ('frame_id', 'u4'),
+    ('class_id', 'i2'),
+    ('confidence', 'f4'),
+    ('bbox', 'i4', (4,)),
+    ('track_id', 'i4'),
+    ('stream', 'u2')
+])
+
+class DetectionHistory:
+    # Кольцевой буфер детекций; запись на диск идет пакетами из фонового потока
+
+    def __init__(self, capacity, log_file=None, flush_interval=5.0, flush_batch=500):
+        self.capacity = max(1, capacity)
+        self.records = np.zeros(self.capacity, dtype=DETECTION_RECORD)
+        self.total_written = 0
+        self.total_flushed = 0
+        self.lost_records = 0
+        self.stream_ids = ['']
+        self.stream_indices = {'': 0}
+        self.lock = threading.Lock()
+        
+        self.log_file = log_file
+        self.flush_interval = flush_interval
+        self.flush_batch = min(flush_batch, self.capacity)
+        self.flush_requested = threading.Event()
+        self.stopped = threading.Event()
+        self.flush_thread = None
+        if log_file:
+            self.flush_thread = threading.Thread(target=self.flush_worker, name="detection-flush", daemon=True)
+            self.flush_thread.start()
+
+    def append(self, timestamp, frame_id, xyxy, confidences, class_ids, track_ids=None, stream_id=''):
+        count = len(xyxy)
+        if count == 0:
+            return
+        if count > self.capacity:
+            xyxy, confidences, class_ids = xyxy[-self.capacity:], confidences[-self.capacity:], class_ids[-self.capacity:]
+            track_ids = track_ids[-self.capacity:] if track_ids is not None else None
+            count = self.capacity
+        
+        with self.lock:
+            indices = (self.total_written + np.arange(count)) % self.capacity
+            records = self.records
+            records['timestamp'][indices] = timestamp
+            records['frame_id'][indices] = frame_id & 0xFFFFFFFF
+            records['class_id'][indices] = class_ids
+            records['confidence'][indices] = confidences
+            records['bbox'][indices] = xyxy
+            records['track_id'][indices] = track_ids if track_ids is not None else -1
+            records['stream'][indices] = self.stream_index(stream_id)
+            self.total_written += count
+            pending = self.total_written - self.total_flushed
+        
+        if self.flush_thread is not None and pending >= self.flush_batch:
+            self.flush_requested.set()
+
+    def stream_index(self, stream_id):
+        index = self.stream_indices.get(stream_id)
+        if index is None:
+            index = self.stream_indices[stream_id] = len(self.stream_ids)
+            self.stream_ids.append(stream_id)
+        return index
+
+    def latest(self, count):
+        indices = (self.total_written - count + np.arange(count)) % self.capacity
+        return self.records[indices]
+
+    def query(self, since=None, until=None, class_id=None, limit=500, stream_id=None):
+        with self.lock:
+            records = self.latest(min(self.total_written, self.capacity))
+        
+        mask = np.ones(len(records), dtype=bool)
+        if since is not None:
+            mask &= records['timestamp'] >= since
+        if until is not None:
+            mask &= records['timestamp'] <= until
+        if class_id is not None:
+            mask &= records['class_id'] == class_id
+        if stream_id is not None:
+            mask &= records['stream'] == self.stream_indices.get(stream_id, -1)
+        return records[mask][-limit:]
+
+    def flush_worker(self):
+        while not self.stopped.is_set():
+            self.flush_requested.wait(self.flush_interval)
+            self.flush_requested.clear()
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            pending = self.total_written - self.total_flushed
+            if pending <= 0:
+                return
+            if pending > self.capacity:
+                self.lost_records += pending - self.capacity
+                pending = self.capacity
+            batch = self.latest(pending)
+            self.total_flushed = self.total_written
+        
+        lines = [json.dumps(record, separators=(',', ':')) for record in records_to_dicts(batch, stream_ids=self.stream_ids)]
+        try:
+            with open(self.log_file, 'a', encoding='utf-8') as file:
+                file.write('\n'.join(lines) + '\n')
+        except OSError as e:
+            logging.error(f"Ошибка записи истории детекций: {e}")
+
+    def close(self):
+        if self.flush_thread is None:
+            return
+        self.stopped.set()
+        self.flush_requested.set()
+        self.flush_thread.join(timeout=5.0)
+        self.flush()
+
+    def get_status(self):
+        return {
+            "stored": min(self.total_written, self.capacity),
+            "capacity": self.capacity,
+            "total_recorded": self.total_written,
+            "pending_flush": self.total_written - self.total_flushed if self.flush_thread else 0,
+            "lost_records": self.lost_records
+        }
+
+def records_to_dicts(records, labels=None, stream_ids=None):
+    result = []
+    for timestamp, frame_id, class_id, confidence, bbox, track_id, stream in zip(
+            records['timestamp'].tolist(), records['frame_id'].tolist(), records['class_id'].tolist(),
+            records['confidence'].tolist(), records['bbox'].tolist(), records['track_id'].tolist(),
+            records['stream'].tolist()):
+        record = {
+            "timestamp": timestamp,
+            "frame_id": frame_id,
+            "class_id": class_id,
+            "confidence": confidence,
+            "bbox": bbox
+        }
+        if labels is not None:
+            record["class"] = labels.get(class_id, str(class_id)) if isinstance(labels, dict) else labels[class_id]
+        if track_id >= 0:
+            record["track_id"] = track_id
+        if stream and stream_ids is not None:
+            record["stream_id"] = stream_ids[stream]
+        result.append(record)
+    return result
+
+class DeferredQueueHandler(QueueHandler):
+    # Форматирование и запись выполняет поток QueueListener, здесь только подстановка аргументов
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+class RateLimitFilter(logging.Filter):
+    # Повторяющиеся предупреждения из одного места пропускаются не чаще раза в интервал
+
+    def __init__(self, interval=5.0, level=logging.WARNING):
+        super().__init__()
+        self.interval = interval
+        self.level = level
+        self.sites = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < self.level or self.interval <= 0:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self.lock:
+            site = self.sites.get(key)
+            if site is not None and now - site[0] < self.interval:
+                site[1] += 1
+                return False
+            suppressed = site[1] if site is not None else 0
+            self.sites[key] = [now, 0]
+        if suppressed:
+            record.msg = f"{record.getMessage()} (подавлено повторов: {suppressed})"
+            record.args = None
+        return True
+
+def start_log_listener(handlers, rate_limit_interval=5.0):
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter(rate_limit_interval))
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(queue_handler)
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+class LogAggregator:
+    # Частые события копятся в счетчиках и пишутся одной сводкой раз в интервал
+
+    def __init__(self, interval=10.0, title="Сводка"):
+        self.interval = interval
+        self.title = title
+        self.counts = OrderedDict()
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+
+    def count(self, event, value=1):
+        with self.lock:
+            self.counts[event] = self.counts.get(event, 0) + value
+            if time.monotonic() - self.started < self.interval:
+                return
+        self.flush()
+
+    def flush(self):
+        with self.lock:
+            counts, elapsed = self.counts, time.monotonic() - self.started
+            self.counts = OrderedDict()
+            self.started = time.monotonic()
+        if counts:
+            logging.info(f"{self.title} за {elapsed:.0f} с: " +
+                         ", ".join(f"{event}={value}" for event, value in counts.items()))
+
+class StartupTimeline:
+
+    def __init__(self, started=PROCESS_STARTED):
+        self.started = started
+        self.marks = OrderedDict()
+        self.lock = threading.Lock()
+
+    def mark(self, name):
+        with self.lock:
+            if name in self.marks:
+                return
+            elapsed = time.monotonic() - self.started
+            self.marks[name] = elapsed
+        logging.info(f"Запуск: {name} через {elapsed * 1000:.0f} мс")
+
+    def as_dict(self):
+        with self.lock:
+            return {name: round(elapsed * 1000, 1) for name, elapsed in self.marks.items()}
+
+DEFAULT_BBOX_COLORS = [
+    [164, 120, 87], [68, 148, 228], [93, 97, 209], [178, 182, 133], [88, 159, 106],
+    [96, 202, 231], [159, 124, 168], [169, 162, 241], [98, 118, 150], [172, 176, 184]
+]
+
+CONFIG_SCHEMA = {
+    'model.confidence_threshold': (float, 0.0, 1.0, 0.5),
+    'model.iou_threshold': (float, 0.0, 1.0, 0.45),
+    'camera.width': (int, 16, 7680, 640),
+    'camera.height': (int, 16, 4320, 480),
+    'camera.fps': (int, 1, 240, 30),
+    'camera.passthrough': (bool, None, None, True),
+    'camera.decode_scale': (int, 1, 8, 1),
+    'stream.jpeg_quality': (int, 1, 100, 70),
+    'stream.target_fps': (float, 0.1, 240.0, 15.0),
+    'stream.resize_output': (bool, None, None, False),
+    'stream.output_width': (int, 16, 7680, 640),
+    'stream.output_height': (int, 16, 4320, 480),
+    'stream.pipeline': (bool, None, None, False),
+    'stream.max_frame_skip': (int, 0, 1000, 0),
+    'adaptive_bitrate.enabled': (bool, None, None, False),
+    'adaptive_bitrate.min_quality': (int, 1, 100, 30),
+    'adaptive_bitrate.quality_step': (int, 1, 100, 10),
+    'adaptive_bitrate.scale_levels': (list, None, None, [1.0, 0.75, 0.5]),
+    'adaptive_bitrate.high_latency': (float, 0.0, None, 0.2),
+    'adaptive_bitrate.low_latency': (float, 0.0, None, 0.05),
+    'adaptive_bitrate.high_buffer_bytes': (int, 0, None, 256 * 1024),
+    'adaptive_bitrate.max_buffer_bytes': (int, 0, None, 1024 * 1024),
+    'adaptive_bitrate.degrade_cooldown': (float, 0.0, None, 1.0),
+    'adaptive_bitrate.recover_after': (float, 0.0, None, 3.0),
+    'adaptive_bitrate.max_send_timeouts': (int, 0, None, 3),
+    'adaptive_bitrate.smoothing': (float, 0.0, 1.0, 0.3),
+    'detection.burn_in': (bool, None, None, True),
+    'detection.show_fps': (bool, None, None, True),
+    'detection.show_object_count': (bool, None, None, True),
+    'detection.show_timestamp': (bool, None, None, False),
+    'detection.bbox_thickness': (int, 1, 32, 2),
+    'detection.font_scale': (float, 0.05, 10.0, 0.5),
+    'detection.font_thickness': (int, 1, 32, 1),
+    'detection.label_background': (bool, None, None, True),
+    'detection.confidence_bucket': (int, 1, 100, 1),
+    'detection.label_cache_size': (int, 0, None, 512),
+    'colors.bbox_colors': (list, None, None, DEFAULT_BBOX_COLORS),
+    'colors.text_color': (list, None, None, [0, 0, 0]),
+    'colors.fps_color': (list, None, None, [0, 255, 255]),
+    'colors.count_color': (list, None, None, [0, 255, 255]),
+    'motion_gate.enabled': (bool, None, None, False),
+    'motion_gate.width': (int, 4, 1024, 64),
+    'motion_gate.height': (int, 4, 1024, 48),
+    'motion_gate.learning_rate': (float, 0.0, 1.0, 0.05),
+    'motion_gate.pixel_threshold': (float, 0.0, 255.0, 25.0),
+    'motion_gate.motion_threshold': (float, 0.0, 1.0, 0.01),
+    'motion_gate.max_staleness': (float, 0.0, None, 2.0),
+    'motion_gate.idle_send_interval': (float, 0.0, None, 1.0),
+    'tracking.enabled': (bool, None, None, False),
+    'tracking.adaptive': (bool, None, None, True),
+    'tracking.method': (str, None, None, 'velocity'),
+    'tracking.iou_threshold': (float, 0.0, 1.0, 0.3),
+    'tracking.min_track_confidence': (float, 0.0, 1.0, 0.4),
+    'tracking.confidence_decay': (float, 0.0, 1.0, 0.9),
+    'tracking.max_missed': (int, 0, None, 2),
+    'tracking.flow_scale': (float, 0.01, 1.0, 0.25),
+    'tiling.enabled': (bool, None, None, False),
+    'tiling.rois': (list, None, None, []),
+    'tiling.tile_size': (int, 32, 4096, 640),
+    'tiling.overlap': (float, 0.0, 0.9, 0.2),
+    'tiling.max_tiles_per_frame': (int, 0, None, 4),
+    'tiling.change_threshold': (float, 0.0, 255.0, 6.0),
+    'tiling.max_staleness': (float, 0.0, None, 2.0),
+    'delta.enabled': (bool, None, None, False),
+    'delta.tile_size': (int, 16, 1024, 80),
+    'delta.threshold': (float, 0.0, 255.0, 6.0),
+    'delta.keyframe_interval': (float, 0.1, None, 5.0),
+    'delta.max_changed_ratio': (float, 0.0, 1.0, 0.6),
+    'logging.summary_interval': (float, 0.1, None, 10.0),
+    'advanced.config_reload_interval': (float, 0.0, None, 2.0)
+}
+
+def set_config_value(data, key, value):
+    *sections, name = key.split('.')
+    for section in sections:
+        data = data.setdefault(section, {})
+    data[name] = value
+
+class ConfigSection:
+
+    def __init__(self, data):
+        for key, value in data.items():
+            setattr(self, key, ConfigSection(value) if isinstance(value, dict) else value)
 
 class JSONConfig:
     
     def __init__(self, config_path="config.json"):
         self.config_path = config_path
-        self.data = self.load_config()
+        self.mtime = None
+        data = self.load_config()
+        errors = self.validate(data)
+        if errors:
+            for error in errors:
+                logging.error(f"Ошибка конфигурации: {error}")
+            sys.exit(1)
+        self.compile(data)
         
     def load_config(self):
         try:
+            self.mtime = os.path.getmtime(self.config_path)
             with open(self.config_path, 'r', encoding='utf-8') as file:
                 config = json.load(file)
                 logging.info(f"Конфигурация загружена из {self.config_path}")
@@ -32,27 +504,1394 @@ class JSONConfig:
             logging.error(f"Ошибка в формате JSON: {e}")
             sys.exit(1)
     
+    @staticmethod
+    def validate(data):
+        errors = []
+        for key, (value_type, minimum, maximum, default) in CONFIG_SCHEMA.items():
+            value = data
+            for name in key.split('.'):
+                value = value.get(name) if isinstance(value, dict) else None
+            if value is None:
+                set_config_value(data, key, default)
+                continue
+            if value_type is float and isinstance(value, int) and not isinstance(value, bool):
+                value = float(value)
+                set_config_value(data, key, value)
+            if not isinstance(value, value_type) or (value_type is int and isinstance(value, bool)):
+                errors.append(f"{key} должен быть типа {value_type.__name__}, получено {value!r}")
+            elif minimum is not None and value < minimum or maximum is not None and value > maximum:
+                errors.append(f"{key}={value} вне диапазона [{minimum}, {maximum}]")
+        return errors
+    
+    def compile(self, data):
+        self.data = data
+        self.flat = {}
+        self.flatten(data, '')
+        self.sections = ConfigSection(data)
+    
+    def flatten(self, data, prefix):
+        for key, value in data.items():
+            self.flat[prefix + key] = value
+            if isinstance(value, dict):
+                self.flatten(value, prefix + key + '.')
+    
+    def __getattr__(self, name):
+        sections = self.__dict__.get('sections')
+        if sections is None or not hasattr(sections, name):
+            raise AttributeError(name)
+        return getattr(sections, name)
+    
     def get(self, key, default=None):
-        keys = key.split('.')
-        value = self.data
+        return self.flat.get(key, default)
+    
+    def stage(self, data):
+        staged = object.__new__(JSONConfig)
+        staged.config_path = self.config_path
+        staged.mtime = self.mtime
+        staged.compile(data)
+        return staged
+    
+    def diff(self, staged):
+        keys = set(self.flat) | set(staged.flat)
+        return sorted(key for key in keys
+                      if not isinstance(staged.flat.get(key), dict) and not isinstance(self.flat.get(key), dict)
+                      and self.flat.get(key) != staged.flat.get(key))
+    
+    def replace(self, staged):
+        changed = self.diff(staged)
+        self.compile(staged.data)
+        return changed
+    
+    def update(self, values):
+        data = json.loads(json.dumps(self.data))
+        for key, value in values.items():
+            if not isinstance(key, str) or isinstance(self.flat.get(key), dict) or \
+                    (key not in self.flat and key.split('.', 1)[0] not in self.data):
+                return None, [f"Неизвестный параметр: {key}"]
+            set_config_value(data, key, value)
+        errors = self.validate(data)
+        if errors:
+            return None, errors
+        return self.stage(data), []
+    
+    def reload_if_changed(self):
+        try:
+            mtime = os.path.getmtime(self.config_path)
+            if mtime == self.mtime:
+                return None
+            self.mtime = mtime
+            with open(self.config_path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except (OSError, json.JSONDecodeError) as e:
+            logging.error(f"Не удалось перечитать конфигурацию: {e}")
+            return None
         
-        for k in keys:
-            if isinstance(value, dict) and k in value:
-                value = value[k]
-            else:
-                return default
-        return value
+        errors = self.validate(data)
+        if errors:
+            logging.error(f"Новая конфигурация отклонена: {'; '.join(errors)}")
+            return None
+        return self.stage(data)
+
+class LatestFrameSlot:
+    # Слот на один элемент для каждого потока: новый кадр вытесняет непрочитанный старый того же потока
+
+    def __init__(self, on_drop=None):
+        self.condition = threading.Condition()
+        self.items = OrderedDict()
+        self.closed = False
+        self.dropped = 0
+        self.on_drop = on_drop
+
+    def put(self, item, key=None):
+        with self.condition:
+            if key in self.items:
+                dropped = self.items.pop(key)
+                self.dropped += 1
+                if self.on_drop is not None:
+                    self.on_drop(dropped)
+            self.items[key] = item
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        with self.condition:
+            if not self.items and not self.closed:
+                self.condition.wait(timeout)
+            if not self.items:
+                return None
+            return self.items.popitem(last=False)[1]
+
+    def get_all(self, timeout=None):
+        with self.condition:
+            if not self.items and not self.closed:
+                self.condition.wait(timeout)
+            items = list(self.items.values())
+            self.items.clear()
+            return items
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.items.clear()
+            self.condition.notify_all()
+
+class PipelineEngine:
+
+    def __init__(self, streamer):
+        self.streamer = streamer
+        on_drop = lambda item: streamer.metrics.increment("dropped_frames")
+        self.captured = LatestFrameSlot(on_drop)
+        self.processed = LatestFrameSlot(on_drop)
+        self.encoded = LatestFrameSlot(self.drop_encoded)
+        self.running = threading.Event()
+        self.threads = []
+
+    def start(self):
+        self.running.set()
+        workers = [(f"capture-{stream.stream_id}", self.capture_worker, (stream,))
+                   for stream in self.streamer.streams.values()]
+        workers += [("inference", self.inference_worker, ()), ("encode", self.encode_worker, ())]
+        for name, target, args in workers:
+            thread = threading.Thread(target=target, args=args, name=f"pipeline-{name}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        logging.info(f"Конвейер обработки запущен: захват ({len(self.streamer.streams)} камер), инференс, кодирование")
+
+    def stop(self):
+        self.running.clear()
+        for slot in (self.captured, self.processed, self.encoded):
+            slot.close()
+        for thread in self.threads:
+            thread.join(timeout=2.0)
+        self.threads = []
+        logging.info(f"Конвейер остановлен. Пропущено кадров: захват={self.captured.dropped}, "
+                     f"инференс={self.processed.dropped}, кодирование={self.encoded.dropped}")
+
+    def drop_encoded(self, item):
+        self.streamer.metrics.increment("dropped_frames")
+        item[2].delta.discard(item[3])
+
+    def pace(self, stream):
+        deadline = time.monotonic() + self.streamer.scheduler.reserve(self.streamer.config.stream.target_fps,
+                                                                      stream.stream_id)
+        remaining = deadline - time.monotonic()
+        while remaining > 0 and self.running.is_set():
+            time.sleep(min(0.1, remaining))
+            remaining = deadline - time.monotonic()
+
+    def capture_worker(self, stream):
+        while self.running.is_set():
+            if not stream.active:
+                time.sleep(0.05)
+                continue
+            self.pace(stream)
+            if not self.running.is_set():
+                break
+            frame, success = self.streamer.capture_frame(stream)
+            if not success:
+                time.sleep(0.1)
+                continue
+            self.captured.put((stream, frame, stream.next_frame_id(), stream.captured_at), stream.stream_id)
+
+    def inference_worker(self):
+        while self.running.is_set():
+            batch = self.captured.get_all(timeout=0.5)
+            if not batch:
+                continue
+            results = self.streamer.process_frames_with_yolo(batch)
+            for (stream, _, frame_id, captured_at), (processed_frame, detection_data, object_count) in zip(batch, results):
+                if stream.motion_gate.should_skip_send():
+                    continue
+                self.processed.put((stream, frame_id, captured_at, processed_frame, detection_data, object_count),
+                                   stream.stream_id)
+
+    def encode_worker(self):
+        while self.running.is_set():
+            item = self.processed.get(timeout=0.5)
+            if item is None:
+                continue
+            stream, frame_id, captured_at, processed_frame, detection_data, object_count = item
+            message = self.streamer.encode_frame_message(processed_frame, detection_data, object_count,
+                                                         frame_id, captured_at, stream)
+            if message is not None:
+                self.encoded.put((message, object_count, stream, frame_id), stream.stream_id)
+
+    async def next_message(self, timeout=0.5):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.encoded.get, timeout)
+
+class OverlayRenderer:
+
+    def __init__(self, config):
+        self.burn_in = config.get('detection.burn_in', True)
+        self.show_fps = config.get('detection.show_fps', True)
+        self.show_object_count = config.get('detection.show_object_count', True)
+        self.show_timestamp = config.get('detection.show_timestamp', False)
+        self.bbox_thickness = config.get('detection.bbox_thickness', 2)
+        self.font_scale = config.get('detection.font_scale', 0.5)
+        self.font_thickness = config.get('detection.font_thickness', 1)
+        self.label_background = config.get('detection.label_background', True)
+        self.confidence_bucket = max(1, config.get('detection.confidence_bucket', 1))
+        self.cache_size = config.get('detection.label_cache_size', 512)
+        
+        self.bbox_colors = [tuple(color) for color in config.get('colors.bbox_colors', DEFAULT_BBOX_COLORS)]
+        self.text_color = tuple(config.get('colors.text_color', [0, 0, 0]))
+        self.fps_color = tuple(config.get('colors.fps_color', [0, 255, 255]))
+        self.count_color = tuple(config.get('colors.count_color', [0, 255, 255]))
+        
+        self.label_cache = OrderedDict()
+        self.hud_cache = {}
+
+    def render(self, frame, detection_data, object_count, fps=None):
+        for detection in detection_data:
+            xmin, ymin, xmax, ymax = detection['bbox']
+            class_id = detection['class_id']
+            color = self.bbox_colors[class_id % len(self.bbox_colors)]
+            cv2.rectangle(frame, (xmin, ymin), (xmax, ymax), color, self.bbox_thickness)
+            
+            sprite, mask = self.label_sprite(class_id, detection['class'], detection['confidence'], color)
+            label_y = max(ymin - sprite.shape[0], 0)
+            self.blit(frame, sprite, mask, xmin, label_y)
+        
+        hud_y = 5
+        if fps is not None and self.show_fps:
+            hud_y = self.draw_hud_line(frame, f'FPS: {fps:.1f}', self.fps_color, hud_y)
+        if fps is not None and self.show_object_count:
+            hud_y = self.draw_hud_line(frame, f'Objects: {object_count}', self.count_color, hud_y)
+        if self.show_timestamp:
+            self.draw_hud_line(frame, datetime.now().strftime('%H:%M:%S'), self.fps_color, hud_y)
+        return frame
+
+    def label_sprite(self, class_id, class_name, confidence, color):
+        bucket = int(confidence * 100) // self.confidence_bucket * self.confidence_bucket
+        key = (class_id, bucket)
+        cached = self.label_cache.get(key)
+        if cached is not None:
+            self.label_cache.move_to_end(key)
+            return cached
+        
+        background = color if self.label_background else None
+        cached = self.render_text(f'{class_name}: {bucket}%', self.font_scale, self.font_thickness,
+                                  self.text_color, background)
+        self.label_cache[key] = cached
+        if len(self.label_cache) > self.cache_size:
+            self.label_cache.popitem(last=False)
+        return cached
+
+    def draw_hud_line(self, frame, text, color, y):
+        cached = self.hud_cache.get((text, color))
+        if cached is None:
+            if len(self.hud_cache) > 64:
+                self.hud_cache.clear()
+            cached = self.render_text(text, 0.7, 2, color, None)
+            self.hud_cache[(text, color)] = cached
+        sprite, mask = cached
+        self.blit(frame, sprite, mask, 10, y)
+        return y + sprite.shape[0] + 5
+
+    @staticmethod
+    def render_text(text, font_scale, thickness, text_color, background):
+        (text_width, text_height), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
+        height = text_height + baseline + 6
+        width = text_width + 4
+        sprite = np.zeros((height, width, 3), dtype=np.uint8)
+        if background is not None:
+            sprite[:] = background
+        cv2.putText(sprite, text, (2, text_height + 3), cv2.FONT_HERSHEY_SIMPLEX,
+                    font_scale, text_color, thickness, cv2.LINE_AA)
+        
+        if background is not None:
+            return sprite, None
+        alpha = np.zeros((height, width), dtype=np.uint8)
+        cv2.putText(alpha, text, (2, text_height + 3), cv2.FONT_HERSHEY_SIMPLEX,
+                    font_scale, 255, thickness, cv2.LINE_AA)
+        return sprite, alpha > 0
+
+    @staticmethod
+    def blit(frame, sprite, mask, x, y):
+        frame_height, frame_width = frame.shape[:2]
+        if x >= frame_width or y >= frame_height:
+            return
+        x = max(x, 0)
+        y = max(y, 0)
+        height = min(sprite.shape[0], frame_height - y)
+        width = min(sprite.shape[1], frame_width - x)
+        region = frame[y:y + height, x:x + width]
+        if mask is None:
+            region[:] = sprite[:height, :width]
+        else:
+            visible = mask[:height, :width]
+            region[visible] = sprite[:height, :width][visible]
+
+def box_iou(boxes_a, boxes_b):
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(boxes_a[:, 2:] - boxes_a[:, :2], axis=1)
+    area_b = np.prod(boxes_b[:, 2:] - boxes_b[:, :2], axis=1)
+    return intersection / np.maximum(area_a[:, None] + area_b[None, :] - intersection, 1e-6)
+
+def non_max_suppression(boxes, scores, class_ids, iou_threshold, max_detections=300):
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    offset_boxes = boxes + (class_ids.astype(np.float32) * (boxes.max() + 1))[:, None]
+    order = np.argsort(-scores)
+    keep = []
+    while len(order) and len(keep) < max_detections:
+        best = order[0]
+        keep.append(best)
+        if len(order) == 1:
+            break
+        overlaps = box_iou(offset_boxes[best:best + 1], offset_boxes[order[1:]])[0]
+        order = order[1:][overlaps <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+def load_ncnn_metadata(metadata_path):
+    names = {}
+    imgsz = []
+    section = None
+    with open(metadata_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            stripped = line.strip()
+            if not stripped:
+                continue
+            if not line[0].isspace() and not stripped.startswith('-'):
+                section = stripped[:-1] if stripped.endswith(':') else None
+            elif section == "names" and ':' in stripped:
+                index, name = stripped.split(':', 1)
+                names[int(index)] = name.strip().strip("'\"")
+            elif section == "imgsz" and stripped.startswith('-'):
+                imgsz.append(int(stripped[1:]))
+    return {"names": names, "imgsz": imgsz or [640, 640]}
+
+class UltralyticsBackend:
+
+    def __init__(self, model_path, config):
+        from ultralytics import YOLO
+        self.model = YOLO(model_path, task='detect')
+        self.names = self.model.names
+        self.iou_threshold = config.get('model.iou_threshold', 0.45)
+
+    def predict(self, frame, confidence_threshold):
+        results = self.model(frame, verbose=False, conf=confidence_threshold, iou=self.iou_threshold)
+        boxes = results[0].boxes
+        return boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy(), boxes.cls.cpu().numpy()
+
+    def predict_batch(self, frames, confidence_threshold):
+        results = self.model(frames, verbose=False, conf=confidence_threshold, iou=self.iou_threshold)
+        return [(result.boxes.xyxy.cpu().numpy(), result.boxes.conf.cpu().numpy(), result.boxes.cls.cpu().numpy())
+                for result in results]
+
+class NcnnBackend:
+
+    def __init__(self, model_path, config):
+        import ncnn
+        self.ncnn = ncnn
+        metadata = load_ncnn_metadata(os.path.join(model_path, 'metadata.yaml'))
+        self.names = metadata["names"]
+        self.input_height, self.input_width = metadata["imgsz"]
+        self.iou_threshold = config.get('model.iou_threshold', 0.45)
+        self.max_detections = config.get('model.max_detections', 300)
+        self.input_name = config.get('model.ncnn_input', 'in0')
+        self.output_name = config.get('model.ncnn_output', 'out0')
+        
+        self.net = ncnn.Net()
+        self.net.opt.num_threads = config.get('model.ncnn_threads', 4)
+        self.net.opt.use_vulkan_compute = False
+        if self.net.load_param(os.path.join(model_path, 'model.ncnn.param')) != 0:
+            raise RuntimeError(f"Не удалось загрузить model.ncnn.param из {model_path}")
+        if self.net.load_model(os.path.join(model_path, 'model.ncnn.bin')) != 0:
+            raise RuntimeError(f"Не удалось загрузить model.ncnn.bin из {model_path}")
+        
+        self.canvas = np.full((self.input_height, self.input_width, 3), 114, dtype=np.uint8)
+        self.input_blob = np.zeros((3, self.input_height, self.input_width), dtype=np.float32)
+        # Mat ссылается на память input_blob, поэтому достаточно перезаписывать массив
+        self.input_mat = ncnn.Mat(self.input_blob)
+
+    def letterbox(self, frame):
+        height, width = frame.shape[:2]
+        ratio = min(self.input_height / height, self.input_width / width)
+        resized_width, resized_height = int(round(width * ratio)), int(round(height * ratio))
+        pad_x = (self.input_width - resized_width) // 2
+        pad_y = (self.input_height - resized_height) // 2
+        
+        self.canvas.fill(114)
+        self.canvas[pad_y:pad_y + resized_height, pad_x:pad_x + resized_width] = cv2.resize(
+            frame, (resized_width, resized_height), interpolation=cv2.INTER_LINEAR)
+        np.multiply(self.canvas[:, :, ::-1].transpose(2, 0, 1), 1.0 / 255.0, out=self.input_blob)
+        return ratio, pad_x, pad_y
+
+    def predict(self, frame, confidence_threshold):
+        ratio, pad_x, pad_y = self.letterbox(frame)
+        
+        with self.net.create_extractor() as extractor:
+            extractor.input(self.input_name, self.input_mat)
+            _, output = extractor.extract(self.output_name)
+        predictions = np.array(output).T
+        
+        scores = predictions[:, 4:]
+        class_ids = scores.argmax(axis=1)
+        confidences = scores[np.arange(len(scores)), class_ids]
+        mask = confidences > confidence_threshold
+        predictions, class_ids, confidences = predictions[mask], class_ids[mask], confidences[mask]
+        
+        centers, sizes = predictions[:, :2], predictions[:, 2:4]
+        boxes = np.concatenate([centers - sizes / 2, centers + sizes / 2], axis=1)
+        boxes -= np.array([pad_x, pad_y, pad_x, pad_y], dtype=np.float32)
+        boxes /= ratio
+        height, width = frame.shape[:2]
+        np.clip(boxes, 0, [width, height, width, height], out=boxes)
+        
+        keep = non_max_suppression(boxes, confidences, class_ids, self.iou_threshold, self.max_detections)
+        return boxes[keep], confidences[keep], class_ids[keep]
+
+    def predict_batch(self, frames, confidence_threshold):
+        return [self.predict(frame, confidence_threshold) for frame in frames]
+
+class TiledInference:
+    # Инференс по областям интереса и перекрывающимся тайлам с повторным использованием неизменившихся тайлов
+
+    def __init__(self, config):
+        self.enabled = config.get('tiling.enabled', False)
+        self.rois = config.get('tiling.rois', [])
+        self.tile_size = config.get('tiling.tile_size', 640)
+        self.overlap = config.get('tiling.overlap', 0.2)
+        self.max_tiles = config.get('tiling.max_tiles_per_frame', 4)
+        self.change_threshold = config.get('tiling.change_threshold', 6.0)
+        self.max_staleness = config.get('tiling.max_staleness', 2.0)
+        self.iou_threshold = config.get('model.iou_threshold', 0.45)
+        self.max_detections = config.get('model.max_detections', 300)
+        self.reset()
+
+    @property
+    def active(self):
+        return self.enabled or bool(self.rois)
+
+    def reset(self):
+        self.layout_shape = None
+        self.tiles = []
+        self.frame_index = 0
+        self.tiles_inferred = 0
+
+    def regions(self, width, height):
+        if not self.rois:
+            return [(0, 0, width, height)]
+        regions = []
+        for x, y, w, h in self.rois:
+            if max(x, y, w, h) <= 1.0:
+                x, y, w, h = x * width, y * height, w * width, h * height
+            x0, y0 = max(0, int(x)), max(0, int(y))
+            x1, y1 = min(width, int(x + w)), min(height, int(y + h))
+            if x1 > x0 and y1 > y0:
+                regions.append((x0, y0, x1, y1))
+        return regions or [(0, 0, width, height)]
+
+    def axis_positions(self, start, length):
+        if not self.enabled or length <= self.tile_size:
+            return [(start, start + length)]
+        step = self.tile_size * (1.0 - self.overlap)
+        count = int(np.ceil((length - self.tile_size) / step)) + 1
+        offsets = np.linspace(start, start + length - self.tile_size, count).round().astype(int)
+        return [(offset, offset + self.tile_size) for offset in offsets.tolist()]
+
+    def build_layout(self, shape):
+        height, width = shape[:2]
+        self.tiles = []
+        for x0, y0, x1, y1 in self.regions(width, height):
+            for tile_y0, tile_y1 in self.axis_positions(y0, y1 - y0):
+                for tile_x0, tile_x1 in self.axis_positions(x0, x1 - x0):
+                    self.tiles.append({
+                        "box": (tile_x0, tile_y0, tile_x1, tile_y1),
+                        "thumbnail": None,
+                        "last_run": None,
+                        "run_at": None,
+                        "detections": (np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32),
+                                       np.zeros(0, dtype=np.int32))
+                    })
+        self.layout_shape = shape
+        logging.info(f"Разбиение кадра {width}x{height} на {len(self.tiles)} тайлов")
+
+    def select_tiles(self, gray):
+        now = time.monotonic()
+        candidates = []
+        for index, tile in enumerate(self.tiles):
+            x0, y0, x1, y1 = tile["box"]
+            thumbnail = cv2.resize(gray[y0:y1, x0:x1], (32, 32), interpolation=cv2.INTER_AREA)
+            if tile["last_run"] is not None:
+                changed = float(cv2.absdiff(thumbnail, tile["thumbnail"]).mean()) > self.change_threshold
+                active = len(tile["detections"][0]) > 0
+                stale = self.max_staleness > 0 and now - tile["run_at"] >= self.max_staleness
+                if not (changed or active or stale):
+                    continue
+            age = self.frame_index - tile["last_run"] if tile["last_run"] is not None else float('inf')
+            candidates.append((-age, index, thumbnail))
+        
+        candidates.sort(key=lambda item: item[0])
+        selected = candidates[:self.max_tiles] if self.max_tiles else candidates
+        return [(index, thumbnail) for _, index, thumbnail in selected]
+
+    def detect(self, frame, backend, confidence_threshold):
+        if self.layout_shape != frame.shape:
+            self.build_layout(frame.shape)
+        self.frame_index += 1
+        
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        selected = self.select_tiles(gray)
+        crops = [frame[y0:y1, x0:x1] for x0, y0, x1, y1 in (self.tiles[index]["box"] for index, _ in selected)]
+        results = backend.predict_batch(crops, confidence_threshold) if crops else []
+        
+        for (index, thumbnail), (xyxy, confidences, class_ids) in zip(selected, results):
+            tile = self.tiles[index]
+            x0, y0 = tile["box"][:2]
+            offset = np.array([x0, y0, x0, y0], dtype=np.float32)
+            tile["detections"] = (np.asarray(xyxy, dtype=np.float32).reshape(-1, 4) + offset,
+                                  np.asarray(confidences, dtype=np.float32),
+                                  np.asarray(class_ids).astype(np.int32))
+            tile["thumbnail"] = thumbnail
+            tile["last_run"] = self.frame_index
+            tile["run_at"] = time.monotonic()
+        self.tiles_inferred += len(selected)
+        
+        boxes = np.concatenate([tile["detections"][0] for tile in self.tiles])
+        confidences = np.concatenate([tile["detections"][1] for tile in self.tiles])
+        class_ids = np.concatenate([tile["detections"][2] for tile in self.tiles])
+        keep = non_max_suppression(boxes, confidences, class_ids, self.iou_threshold, self.max_detections)
+        return boxes[keep], confidences[keep], class_ids[keep]
+
+    def get_status(self):
+        return {
+            "enabled": self.enabled,
+            "rois": len(self.rois),
+            "tiles": len(self.tiles),
+            "tiles_inferred": self.tiles_inferred,
+            "frames": self.frame_index
+        }
+
+MODEL_BACKENDS = {
+    "ultralytics": UltralyticsBackend,
+    "ncnn": NcnnBackend
+}
+
+class DetectionTracker:
+    # Между запусками детектора рамки переносятся по скорости или оптическому потоку
+
+    def __init__(self, config):
+        self.enabled = config.get('tracking.enabled', False)
+        self.max_frame_skip = max(0, config.get('stream.max_frame_skip', 0))
+        self.adaptive = config.get('tracking.adaptive', True)
+        self.method = config.get('tracking.method', 'velocity')
+        self.iou_threshold = config.get('tracking.iou_threshold', 0.3)
+        self.min_track_confidence = config.get('tracking.min_track_confidence', 0.4)
+        self.confidence_decay = config.get('tracking.confidence_decay', 0.9)
+        self.max_missed = config.get('tracking.max_missed', 2)
+        self.flow_scale = config.get('tracking.flow_scale', 0.25)
+        self.reset()
+
+    def reset(self):
+        self.boxes = np.zeros((0, 4), dtype=np.float32)
+        self.detected_boxes = np.zeros((0, 4), dtype=np.float32)
+        self.detected_at = np.zeros(0, dtype=np.int64)
+        self.velocities = np.zeros((0, 4), dtype=np.float32)
+        self.confidences = np.zeros(0, dtype=np.float32)
+        self.class_ids = np.zeros(0, dtype=np.int32)
+        self.track_ids = np.zeros(0, dtype=np.int32)
+        self.track_confidence = np.zeros(0, dtype=np.float32)
+        self.missed = np.zeros(0, dtype=np.int32)
+        self.next_track_id = 1
+        self.frame_index = 0
+        self.frames_since_detection = self.max_frame_skip
+        self.previous_gray = None
+        self.detector_runs = 0
+        self.propagated_frames = 0
+
+    def should_detect(self):
+        if not self.enabled or self.frames_since_detection >= self.max_frame_skip:
+            return True
+        if self.adaptive and len(self.track_confidence) and self.track_confidence.min() < self.min_track_confidence:
+            return True
+        return False
+
+    def update(self, xyxy, confidences, class_ids, frame):
+        self.frame_index += 1
+        boxes = xyxy.astype(np.float32)
+        track_ids = np.zeros(len(boxes), dtype=np.int32)
+        velocities = np.zeros((len(boxes), 4), dtype=np.float32)
+        matched_tracks = np.zeros(len(self.boxes), dtype=bool)
+        
+        if len(self.boxes) and len(boxes):
+            iou = box_iou(boxes, self.boxes)
+            iou[class_ids[:, None] != self.class_ids[None, :]] = 0
+            for detection_index, track_index in zip(*np.unravel_index(np.argsort(-iou, axis=None), iou.shape)):
+                if iou[detection_index, track_index] < self.iou_threshold:
+                    break
+                if track_ids[detection_index] or matched_tracks[track_index]:
+                    continue
+                track_ids[detection_index] = self.track_ids[track_index]
+                velocities[detection_index] = ((boxes[detection_index] - self.detected_boxes[track_index])
+                                               / (self.frame_index - self.detected_at[track_index]))
+                matched_tracks[track_index] = True
+        
+        new_tracks = track_ids == 0
+        track_ids[new_tracks] = np.arange(self.next_track_id, self.next_track_id + new_tracks.sum())
+        self.next_track_id += int(new_tracks.sum())
+        
+        lost = ~matched_tracks
+        missed = self.missed[lost] + 1
+        keep = missed <= self.max_missed
+        
+        self.boxes = np.concatenate([boxes, self.boxes[lost][keep]])
+        self.detected_boxes = np.concatenate([boxes, self.detected_boxes[lost][keep]])
+        self.detected_at = np.concatenate([np.full(len(boxes), self.frame_index, dtype=np.int64),
+                                           self.detected_at[lost][keep]])
+        self.velocities = np.concatenate([velocities, self.velocities[lost][keep]])
+        self.confidences = np.concatenate([confidences.astype(np.float32), self.confidences[lost][keep]])
+        self.class_ids = np.concatenate([class_ids.astype(np.int32), self.class_ids[lost][keep]])
+        self.track_ids = np.concatenate([track_ids, self.track_ids[lost][keep]])
+        self.track_confidence = np.concatenate([np.ones(len(boxes), dtype=np.float32),
+                                                self.track_confidence[lost][keep] * self.confidence_decay])
+        self.missed = np.concatenate([np.zeros(len(boxes), dtype=np.int32), missed[keep]])
+        
+        self.frames_since_detection = 0
+        self.detector_runs += 1
+        if self.method == 'optical_flow':
+            self.previous_gray = self.small_gray(frame)
+        return track_ids
+
+    def propagate(self, frame):
+        self.frame_index += 1
+        self.frames_since_detection += 1
+        self.propagated_frames += 1
+        
+        if self.method == 'optical_flow' and self.previous_gray is not None and len(self.boxes):
+            gray = self.small_gray(frame)
+            self.apply_optical_flow(self.previous_gray, gray)
+            self.previous_gray = gray
+        else:
+            self.boxes = self.boxes + self.velocities
+            self.track_confidence = self.track_confidence * self.confidence_decay
+        
+        visible = self.missed == 0
+        height, width = frame.shape[:2]
+        boxes = np.clip(self.boxes[visible], 0, [width - 1, height - 1, width - 1, height - 1])
+        return (boxes.astype(np.int32), self.confidences[visible], self.class_ids[visible],
+                self.track_ids[visible])
+
+    def small_gray(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(gray, None, fx=self.flow_scale, fy=self.flow_scale, interpolation=cv2.INTER_AREA)
+
+    def apply_optical_flow(self, previous_gray, gray):
+        scaled = self.boxes * self.flow_scale
+        centers = np.stack([(scaled[:, 0] + scaled[:, 2]) / 2, (scaled[:, 1] + scaled[:, 3]) / 2], axis=1)
+        offsets = np.stack([scaled[:, 2] - scaled[:, 0], scaled[:, 3] - scaled[:, 1]], axis=1) / 4
+        grid = np.array([[0, 0], [-1, -1], [1, -1], [-1, 1], [1, 1]], dtype=np.float32)
+        points = (centers[:, None, :] + grid[None, :, :] * offsets[:, None, :]).reshape(-1, 1, 2).astype(np.float32)
+        
+        next_points, status, _ = cv2.calcOpticalFlowPyrLK(previous_gray, gray, points, None,
+                                                          winSize=(15, 15), maxLevel=2)
+        status = status.reshape(len(self.boxes), len(grid)).astype(bool)
+        shifts = (next_points - points).reshape(len(self.boxes), len(grid), 2)
+        shifts[~status] = np.nan
+        
+        with np.errstate(all='ignore'):
+            median_shift = np.nan_to_num(np.nanmedian(shifts, axis=1)) / self.flow_scale
+        self.boxes = self.boxes + np.tile(median_shift, 2).astype(np.float32)
+        self.track_confidence = self.track_confidence * (status.mean(axis=1) * self.confidence_decay)
+
+class MotionGate:
+    # Пропускает инференс, пока маленькая фоновая модель не видит изменений в кадре
+
+    def __init__(self, config):
+        self.enabled = config.get('motion_gate.enabled', False)
+        self.size = (config.get('motion_gate.width', 64), config.get('motion_gate.height', 48))
+        self.learning_rate = config.get('motion_gate.learning_rate', 0.05)
+        self.pixel_threshold = config.get('motion_gate.pixel_threshold', 25)
+        self.motion_threshold = config.get('motion_gate.motion_threshold', 0.01)
+        self.max_staleness = config.get('motion_gate.max_staleness', 2.0)
+        self.idle_send_interval = config.get('motion_gate.idle_send_interval', 1.0)
+        self.reset()
+
+    def reset(self):
+        self.background = None
+        self.static = False
+        self.motion_level = 0.0
+        self.last_inference = 0.0
+        self.last_idle_send = 0.0
+        self.frames_checked = 0
+        self.inferences_skipped = 0
+
+    def observe(self, frame):
+        if not self.enabled:
+            return
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.float32)
+        if self.background is None:
+            self.background = gray
+            self.static = False
+            return
+        
+        changed = cv2.absdiff(gray, self.background) > self.pixel_threshold
+        self.motion_level = float(changed.mean())
+        self.static = self.motion_level <= self.motion_threshold
+        cv2.accumulateWeighted(gray, self.background, self.learning_rate)
+
+    def should_infer(self):
+        if not self.enabled:
+            return True
+        self.frames_checked += 1
+        now = time.monotonic()
+        if not self.static or now - self.last_inference >= self.max_staleness:
+            self.last_inference = now
+            return True
+        self.inferences_skipped += 1
+        return False
+
+    def should_skip_send(self):
+        if not self.enabled or not self.static:
+            return False
+        now = time.monotonic()
+        if now - self.last_idle_send >= self.idle_send_interval:
+            self.last_idle_send = now
+            return False
+        return True
+
+    def get_status(self):
+        return {
+            "enabled": self.enabled,
+            "static": self.static,
+            "motion_level": round(self.motion_level, 4),
+            "frames_checked": self.frames_checked,
+            "inferences_skipped": self.inferences_skipped,
+            "hit_rate": round(self.inferences_skipped / self.frames_checked, 3) if self.frames_checked else 0.0
+        }
+
+class AdaptiveBitrateController:
+
+    def __init__(self, config):
+        self.enabled = config.get('adaptive_bitrate.enabled', False)
+        self.base_quality = config.get('stream.jpeg_quality', 70)
+        self.resize_output = config.get('stream.resize_output', False)
+        self.output_size = (config.get('stream.output_width', 640), config.get('stream.output_height', 480))
+        
+        min_quality = config.get('adaptive_bitrate.min_quality', 30)
+        quality_step = max(1, config.get('adaptive_bitrate.quality_step', 10))
+        scale_levels = config.get('adaptive_bitrate.scale_levels', [1.0, 0.75, 0.5])
+        qualities = list(range(self.base_quality, min_quality - 1, -quality_step)) or [self.base_quality]
+        self.levels = [(quality, 1.0) for quality in qualities]
+        self.levels += [(qualities[-1], scale) for scale in scale_levels if scale < 1.0]
+        
+        self.high_latency = config.get('adaptive_bitrate.high_latency', 0.2)
+        self.low_latency = config.get('adaptive_bitrate.low_latency', 0.05)
+        self.high_buffer_bytes = config.get('adaptive_bitrate.high_buffer_bytes', 256 * 1024)
+        self.max_buffer_bytes = config.get('adaptive_bitrate.max_buffer_bytes', 1024 * 1024)
+        self.degrade_cooldown = config.get('adaptive_bitrate.degrade_cooldown', 1.0)
+        self.recover_after = config.get('adaptive_bitrate.recover_after', 3.0)
+        self.max_send_timeouts = config.get('adaptive_bitrate.max_send_timeouts', 3)
+        self.smoothing = config.get('adaptive_bitrate.smoothing', 0.3)
+        
+        self.level = 0
+        self.latency = 0.0
+        self.last_change = 0.0
+        self.healthy_since = None
+        self.consecutive_timeouts = 0
+        self.skipped_frames = 0
+
+    def current_settings(self, frame_shape):
+        height, width = frame_shape[:2]
+        if self.resize_output:
+            width, height = self.output_size
+        if not self.enabled:
+            return self.base_quality, (width, height)
+        quality, scale = self.levels[self.level]
+        return quality, (max(16, int(width * scale)), max(16, int(height * scale)))
+
+    def allows_passthrough(self, size):
+        if self.resize_output and tuple(self.output_size) != tuple(size):
+            return False
+        return not self.enabled or self.level == 0
+
+    def should_skip(self, buffered_bytes):
+        if self.enabled and buffered_bytes > self.max_buffer_bytes:
+            self.skipped_frames += 1
+            self.step(+1, time.monotonic())
+            return True
+        return False
+
+    def observe_send(self, latency, buffered_bytes):
+        self.consecutive_timeouts = 0
+        if not self.enabled:
+            return
+        self.latency += self.smoothing * (latency - self.latency)
+        now = time.monotonic()
+        
+        if self.latency > self.high_latency or buffered_bytes > self.high_buffer_bytes:
+            self.healthy_since = None
+            self.step(+1, now)
+        elif self.latency < self.low_latency and buffered_bytes < self.high_buffer_bytes / 4:
+            if self.healthy_since is None:
+                self.healthy_since = now
+            elif now - self.healthy_since >= self.recover_after:
+                self.healthy_since = now
+                self.step(-1, now, cooldown=0)
+        else:
+            self.healthy_since = None
+
+    def observe_timeout(self):
+        self.consecutive_timeouts += 1
+        if self.enabled:
+            self.level = len(self.levels) - 1
+            self.last_change = time.monotonic()
+            logging.warning(f"Таймаут отправки, качество снижено до {self.levels[self.level]}")
+        return self.enabled and self.consecutive_timeouts < self.max_send_timeouts
+
+    def step(self, direction, now, cooldown=None):
+        cooldown = self.degrade_cooldown if cooldown is None else cooldown
+        new_level = min(max(self.level + direction, 0), len(self.levels) - 1)
+        if new_level == self.level or now - self.last_change < cooldown:
+            return
+        self.level = new_level
+        self.last_change = now
+        quality, scale = self.levels[new_level]
+        logging.info(f"Адаптация потока: качество JPEG {quality}, масштаб {scale} "
+                     f"(задержка {self.latency * 1000:.0f} мс)")
+
+    def get_status(self):
+        quality, scale = self.levels[self.level]
+        return {
+            "enabled": self.enabled,
+            "jpeg_quality": quality if self.enabled else self.base_quality,
+            "scale": scale if self.enabled else 1.0,
+            "send_latency_ms": round(self.latency * 1000, 1),
+            "skipped_frames": self.skipped_frames
+        }
+
+JPEG_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8
+}
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+class FrameThrottle:
+
+    def __init__(self, fps):
+        self.interval = 1.0 / fps if fps else 0.0
+        self.next_frame_at = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        delay = self.next_frame_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self.next_frame_at = max(self.next_frame_at + self.interval, time.monotonic() - self.interval)
+
+class CaptureSource:
+    # Общий интерфейс источников кадров, совместимый с cv2.VideoCapture; last_jpeg хранит исходный JPEG, если он есть
+    warmup_delay = 0.0
+
+    def __init__(self, fps=0):
+        self.throttle = FrameThrottle(fps)
+        self.decode_flag = cv2.IMREAD_COLOR
+        self.last_jpeg = None
+        self.pending = (False, None)
+
+    def set_decode_scale(self, scale):
+        self.decode_flag = JPEG_DECODE_FLAGS.get(scale, cv2.IMREAD_COLOR)
+
+    def decode(self, data):
+        frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), self.decode_flag)
+        self.last_jpeg = data if frame is not None else None
+        return frame is not None, frame
+
+    def isOpened(self):
+        return True
+
+    def read(self):
+        self.throttle.wait()
+        self.last_jpeg = None
+        return self.next_frame()
+
+    def next_frame(self):
+        raise NotImplementedError
+
+    def grab(self):
+        self.pending = self.read()
+        return self.pending[0]
+
+    def retrieve(self):
+        return self.pending
+
+    def set(self, prop, value):
+        return True
+
+    def get(self, prop):
+        return 0
+
+    def release(self):
+        pass
+
+class V4L2Source(CaptureSource):
+    # Камера в режиме MJPEG без конвертации: кадр приходит сжатым и может уйти клиенту без перекодирования
+    warmup_delay = 0.5
+
+    def __init__(self, device, spec, stream):
+        super().__init__(spec.get('fps', 0))
+        self.capture = cv2.VideoCapture(device)
+        self.raw_jpeg = False
+        if spec.get('mjpeg', True) and self.capture.isOpened():
+            mjpeg = cv2.VideoWriter_fourcc(*'MJPG')
+            self.capture.set(cv2.CAP_PROP_FOURCC, mjpeg)
+            if int(self.capture.get(cv2.CAP_PROP_FOURCC)) == mjpeg:
+                self.raw_jpeg = bool(self.capture.set(cv2.CAP_PROP_CONVERT_RGB, 0))
+
+    def isOpened(self):
+        return self.capture.isOpened()
+
+    def read(self):
+        self.throttle.wait()
+        return self.unpack(*self.capture.read())
+
+    def grab(self):
+        return self.capture.grab()
+
+    def retrieve(self):
+        return self.unpack(*self.capture.retrieve())
+
+    def unpack(self, ret, data):
+        self.last_jpeg = None
+        if not ret or data is None:
+            return False, None
+        if self.raw_jpeg and (data.ndim == 1 or data.shape[0] == 1):
+            return self.decode(data.tobytes())
+        return True, data
+
+    def set(self, prop, value):
+        return self.capture.set(prop, value)
+
+    def get(self, prop):
+        return self.capture.get(prop)
+
+    def release(self):
+        self.capture.release()
+
+class VideoFileSource(CaptureSource):
+
+    def __init__(self, device, spec, stream):
+        super().__init__(spec.get('fps', 0))
+        self.loop = spec.get('loop', True)
+        self.capture = cv2.VideoCapture(spec.get('path', device))
+
+    def isOpened(self):
+        return self.capture.isOpened()
+
+    def next_frame(self):
+        ret, frame = self.capture.read()
+        if not ret and self.loop:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.capture.read()
+        return ret, frame
+
+    def get(self, prop):
+        return self.capture.get(prop)
+
+    def release(self):
+        self.capture.release()
+
+class ImageDirectorySource(CaptureSource):
+
+    def __init__(self, device, spec, stream):
+        super().__init__(spec.get('fps', 0))
+        self.loop = spec.get('loop', True)
+        path = spec.get('path', device)
+        self.files = sorted(os.path.join(path, name) for name in os.listdir(path)
+                            if name.lower().endswith(IMAGE_EXTENSIONS)) if os.path.isdir(path) else []
+        self.index = 0
+
+    def isOpened(self):
+        return bool(self.files)
+
+    def next_frame(self):
+        if self.index >= len(self.files):
+            if not self.loop:
+                return False, None
+            self.index = 0
+        path = self.files[self.index]
+        self.index += 1
+        if path.lower().endswith(('.jpg', '.jpeg')):
+            with open(path, 'rb') as file:
+                return self.decode(file.read())
+        frame = cv2.imread(path)
+        return frame is not None, frame
+
+class SyntheticSource(CaptureSource):
+
+    def __init__(self, device, spec, stream):
+        super().__init__(spec.get('fps', 0))
+        self.width = spec.get('width', stream.width)
+        self.height = spec.get('height', stream.height)
+        rng = np.random.default_rng(spec.get('seed', 0))
+        self.background = rng.integers(0, 255, (self.height, self.width, 3), dtype=np.uint8)
+        self.positions = rng.uniform(0, 1, (spec.get('objects', 5), 2))
+        self.velocities = rng.uniform(-0.01, 0.01, (spec.get('objects', 5), 2))
+
+    def next_frame(self):
+        frame = self.background.copy()
+        self.positions = (self.positions + self.velocities) % 1.0
+        for x, y in self.positions:
+            center = (int(x * self.width), int(y * self.height))
+            cv2.circle(frame, center, self.height // 10, (255, 255, 255), cv2.FILLED)
+        return True, frame
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.width
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.height
+        return 0
+
+CAPTURE_SOURCES = {
+    "v4l2": V4L2Source,
+    "video": VideoFileSource,
+    "images": ImageDirectorySource,
+    "synthetic": SyntheticSource
+}
+
+class FrameGrabber:
+    # Отдельный поток постоянно вычитывает камеру, чтобы в обработку шел самый свежий кадр
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.condition = threading.Condition()
+        self.frame = None
+        self.jpeg = None
+        self.captured_at = None
+        self.sequence = 0
+        self.consumed = 0
+        self.failures = 0
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name=f"grab-{stream.stream_id}", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while self.running and self.stream.active:
+            try:
+                if self.stream.settings_changed:
+                    self.stream.apply_settings()
+                ret, frame = self.stream.camera.read()
+            except Exception:
+                ret, frame = False, None
+            with self.condition:
+                if ret and frame is not None:
+                    self.frame = frame
+                    self.jpeg = getattr(self.stream.camera, 'last_jpeg', None)
+                    self.captured_at = time.time()
+                    self.sequence += 1
+                    self.failures = 0
+                else:
+                    self.failures += 1
+                self.condition.notify_all()
+            if not ret:
+                time.sleep(0.05)
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+    def latest(self, timeout=1.0):
+        with self.condition:
+            self.condition.wait_for(lambda: self.sequence != self.consumed or self.failures or not self.running,
+                                    timeout)
+            if self.sequence == self.consumed:
+                return None, None, None
+            self.stream.stale_frames += self.sequence - self.consumed - 1
+            self.consumed = self.sequence
+            return self.frame, self.jpeg, self.captured_at
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not threading.current_thread():
+            self.thread.join(timeout=2.0)
+
+class FrameScheduler:
+    # Кадры планируются по абсолютным дедлайнам: время обработки учитывается, при отставании слоты пропускаются
+
+    def __init__(self):
+        self.deadlines = {}
+        self.lock = threading.Lock()
+        self.late_frames = 0
+        self.skipped_slots = 0
+
+    def reserve(self, target_fps, key=None):
+        interval = 1.0 / target_fps
+        now = time.monotonic()
+        with self.lock:
+            deadline = self.deadlines.get(key, now) + interval
+            if deadline >= now:
+                self.deadlines[key] = deadline
+                return deadline - now
+            
+            missed = int((now - deadline) / interval)
+            self.late_frames += 1
+            self.skipped_slots += missed
+            self.deadlines[key] = deadline + missed * interval
+            return 0.0
+
+    async def wait(self, target_fps):
+        await asyncio.sleep(self.reserve(target_fps))
+
+    def get_status(self):
+        return {
+            "late_frames": self.late_frames,
+            "skipped_slots": self.skipped_slots
+        }
+
+class DeltaEncoder:
+    # Ключевой кадр уходит целиком, дальше только тайлы, заметно изменившиеся с последней отправки
+
+    def __init__(self, config):
+        self.enabled = config.get('delta.enabled', False)
+        self.tile_size = max(16, config.get('delta.tile_size', 80))
+        self.threshold = config.get('delta.threshold', 6.0)
+        self.keyframe_interval = config.get('delta.keyframe_interval', 5.0)
+        self.max_changed_ratio = config.get('delta.max_changed_ratio', 0.6)
+        self.keyframes = 0
+        self.deltas = 0
+        self.tiles_sent = 0
+        self.keyframe_bytes = 0
+        self.delta_bytes = 0
+        self.reset()
+
+    def reset(self):
+        self.reference = None
+        self.keyframe_id = None
+        self.keyframe_at = 0.0
+        self.pending = OrderedDict()
+        self.lock = threading.Lock()
+
+    def force_keyframe(self):
+        self.reference = None
+
+    def plan(self, frame, frame_id):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        now = time.monotonic()
+        reference, keyframe_id = self.reference, self.keyframe_id
+        if reference is None or reference.shape != gray.shape or \
+                now - self.keyframe_at >= self.keyframe_interval:
+            return self.queue(frame_id, None, gray, now)
+        
+        size = self.tile_size
+        height, width = gray.shape
+        rows, cols = -(-height // size), -(-width // size)
+        diff = cv2.absdiff(gray, reference)
+        padded = cv2.copyMakeBorder(diff, 0, rows * size - height, 0, cols * size - width, cv2.BORDER_CONSTANT, value=0)
+        sums = padded.reshape(rows, size, cols, size).sum(axis=(1, 3), dtype=np.uint32)
+        areas = np.outer(np.minimum(size, height - np.arange(rows) * size),
+                         np.minimum(size, width - np.arange(cols) * size))
+        changed = np.argwhere(sums > self.threshold * areas)
+        if len(changed) > self.max_changed_ratio * rows * cols:
+            return self.queue(frame_id, None, gray, now)
+        
+        tiles = []
+        for row, col in changed:
+            y, x = int(row) * size, int(col) * size
+            tiles.append((x, y, min(size, width - x), min(size, height - y)))
+        self.queue(frame_id, keyframe_id, gray, now)
+        return tiles
+
+    def queue(self, frame_id, keyframe_id, gray, now):
+        with self.lock:
+            self.pending[frame_id] = [keyframe_id, gray, now, None, 0]
+            while len(self.pending) > 8:
+                self.pending.popitem(last=False)
+        return None
+
+    def record(self, frame_id, tiles, size):
+        with self.lock:
+            entry = self.pending.get(frame_id)
+            if entry is not None:
+                entry[3], entry[4] = tiles, size
+
+    def keyframe_for(self, frame_id):
+        with self.lock:
+            entry = self.pending.get(frame_id)
+        return frame_id if entry is None or entry[0] is None else entry[0]
+
+    def is_stale(self, frame_id):
+        with self.lock:
+            entry = self.pending.get(frame_id)
+        return entry is not None and entry[0] is not None and \
+            (entry[0] != self.keyframe_id or self.reference is None)
+
+    def discard(self, frame_id):
+        with self.lock:
+            self.pending.pop(frame_id, None)
+
+    def commit(self, frame_id):
+        with self.lock:
+            if frame_id not in self.pending:
+                return
+            while True:
+                pending_id, entry = self.pending.popitem(last=False)
+                if pending_id == frame_id:
+                    break
+        
+        keyframe_id, gray, planned_at, tiles, size = entry
+        if keyframe_id is None:
+            self.reference = gray
+            self.keyframe_id = frame_id
+            self.keyframe_at = planned_at
+            self.keyframes += 1
+            self.keyframe_bytes += size
+            return
+        if keyframe_id != self.keyframe_id or self.reference is None:
+            return
+        
+        reference = self.reference.copy()
+        for x, y, w, h in tiles:
+            reference[y:y + h, x:x + w] = gray[y:y + h, x:x + w]
+        self.reference = reference
+        self.deltas += 1
+        self.delta_bytes += size
+        self.tiles_sent += len(tiles)
+
+    def get_status(self):
+        frames = self.keyframes + self.deltas
+        full_bytes = self.keyframe_bytes / self.keyframes * frames if self.keyframes else 0
+        sent_bytes = self.keyframe_bytes + self.delta_bytes
+        return {
+            "enabled": self.enabled,
+            "keyframes": self.keyframes,
+            "deltas": self.deltas,
+            "tiles_sent": self.tiles_sent,
+            "bytes_sent": sent_bytes,
+            "savings": round(1 - sent_bytes / full_bytes, 3) if full_bytes else 0.0
+        }
+
+class CameraStream:
+    # Одна камера со своим идентификатором потока, трекером, детектором движения и тайлами
+
+    def __init__(self, stream_id, config, options=None):
+        self.stream_id = stream_id
+        self.options = options or {}
+        self.configure(config)
+        self.settings_changed = False
+        
+        self.camera = None
+        self.grabber = None
+        self.active = False
+        self.consecutive_errors = 0
+        self.stale_frames = 0
+        self.captured_at = None
+        self.captured_jpeg = None
+        self.jpeg_frames = OrderedDict()
+        self.jpeg_lock = threading.Lock()
+        self.frame_age = None
+        self.sequence = 0
+        self.frames_sent = 0
+        self.current_fps = 0
+        self.fps_counter = 0
+        self.fps_time = time.time()
+        
+        self.tracker = DetectionTracker(config)
+        self.motion_gate = MotionGate(config)
+        self.tiler = TiledInference(config)
+        self.delta = DeltaEncoder(config)
+        self.last_detections = None
+
+    def configure(self, config):
+        self.device_options = self.options.get('device_options', config.get('camera.device_options', [0]))
+        self.source = self.options.get('source', config.get('camera.source', {"type": "v4l2"}))
+        self.width = self.options.get('width', config.camera.width)
+        self.height = self.options.get('height', config.camera.height)
+        self.fps = self.options.get('fps', config.camera.fps)
+        self.buffer_size = config.get('camera.buffer_size', 1)
+        self.settings_changed = True
+
+    def apply_settings(self):
+        self.settings_changed = False
+        self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        self.camera.set(cv2.CAP_PROP_FPS, self.fps)
+        if self.buffer_size:
+            self.camera.set(cv2.CAP_PROP_BUFFERSIZE, self.buffer_size)
+
+    def is_open(self):
+        return self.camera is not None and self.camera.isOpened()
+
+    def release(self):
+        if self.grabber is not None:
+            self.grabber.stop()
+            self.grabber = None
+        if self.camera is not None:
+            self.camera.release()
+            self.camera = None
+
+    def reset(self):
+        self.tracker.reset()
+        self.motion_gate.reset()
+        self.tiler.reset()
+        self.delta.reset()
+        self.last_detections = None
+
+    def next_frame_id(self):
+        self.sequence += 1
+        if self.captured_jpeg is not None:
+            with self.jpeg_lock:
+                self.jpeg_frames[self.sequence] = self.captured_jpeg
+                while len(self.jpeg_frames) > 8:
+                    self.jpeg_frames.popitem(last=False)
+            self.captured_jpeg = None
+        return self.sequence
+
+    def take_jpeg(self, frame_id):
+        with self.jpeg_lock:
+            return self.jpeg_frames.pop(frame_id, None)
+
+    def count_sent(self):
+        self.frames_sent += 1
+        self.fps_counter += 1
+        now = time.time()
+        if now - self.fps_time >= 1.0:
+            self.current_fps = self.fps_counter / (now - self.fps_time)
+            self.fps_counter = 0
+            self.fps_time = now
+
+    def get_status(self):
+        return {
+            "active": self.active,
+            "camera_initialized": self.is_open(),
+            "source": self.source.get('type', 'v4l2'),
+            "frames_sent": self.frames_sent,
+            "fps": self.current_fps,
+            "frame_age_ms": round(self.frame_age * 1000, 1) if self.frame_age is not None else None,
+            "stale_frames": self.stale_frames,
+            "motion_gate": self.motion_gate.get_status(),
+            "tiling": self.tiler.get_status(),
+            "delta": self.delta.get_status(),
+            "tracking": {
+                "enabled": self.tracker.enabled,
+                "detector_runs": self.tracker.detector_runs,
+                "propagated_frames": self.tracker.propagated_frames,
+                "active_tracks": len(self.tracker.track_ids)
+            }
+        }
 
 class RobustYOLOStreamer:
     def __init__(self, config_path="config.json"):
+        self.timeline = StartupTimeline()
         self.config = JSONConfig(config_path)
+        self.log_listener = None
         self.setup_logging()
+        self.log_events = LogAggregator(self.config.get('logging.summary_interval', 10.0), "Поток")
+        self.timeline.mark("imports")
         
         self.server_url = self.config.get('server.url')
         self.model_path = self.config.get('model.path')
-        self.confidence_thresh = self.config.get('model.confidence_threshold', 0.5)
+        self.confidence_thresh = self.config.model.confidence_threshold
         
-        self.camera = None
+        self.streams = self.build_streams()
         self.model = None
         self.labels = None
         self.is_streaming = False
@@ -65,18 +1904,41 @@ class RobustYOLOStreamer:
         self.reconnect_backoff = self.config.get('server.reconnect_backoff', 2)
         
         self.last_successful_frame = 0
-        self.consecutive_errors = 0
         self.max_consecutive_errors = 5
+        self.capture_mode = self.config.get('camera.capture_mode', 'thread')
+        self.scheduler = FrameScheduler()
+        self.drain_limit = self.config.get('camera.drain_limit', 4)
+        self.passthrough = self.config.get('camera.passthrough', True)
+        self.decode_scale = self.config.get('camera.decode_scale', 1)
         
         self.shutdown_requested = False
         self.connection_active = False
         
         self.message_queue = asyncio.Queue()
         
-        self.bbox_colors = self.config.get('colors.bbox_colors', [
-            [164, 120, 87], [68, 148, 228], [93, 97, 209], [178, 182, 133], [88, 159, 106],
-            [96, 202, 231], [159, 124, 168], [169, 162, 241], [98, 118, 150], [172, 176, 184]
-        ])
+        self.preferred_protocol = self.config.get('stream.protocol', BINARY_PROTOCOL)
+        self.frame_protocol = JSON_PROTOCOL
+        self.delta_supported = False
+        
+        self.overlay = OverlayRenderer(self.config)
+        self.bitrate = AdaptiveBitrateController(self.config)
+        
+        self.model_lock = threading.Lock()
+        self.stage_observer = None
+        self.metrics = StreamerMetrics(self.config.get('advanced.enable_metrics', False))
+        self.metrics_host = self.config.get('advanced.metrics_host', '127.0.0.1')
+        self.metrics_port = self.config.get('advanced.metrics_port', 9100)
+        self.metrics_server = None
+        
+        self.history = DetectionHistory(
+            self.config.get('advanced.max_detection_history', 1000),
+            self.config.get('advanced.detection_log_file') if self.config.get('advanced.save_detections', False) else None,
+            self.config.get('advanced.detection_flush_interval', 5.0),
+            self.config.get('advanced.detection_flush_batch', 500)
+        )
+        self.startup_task = None
+        self.eager_camera = self.config.get('startup.eager_camera', True)
+        self.warmup_runs = self.config.get('startup.warmup_runs', 2)
         
         logging.info("Robust YOLO Streamer инициализирован")
         
@@ -93,21 +1955,50 @@ class RobustYOLOStreamer:
         log_format = self.config.get('logging.format', '%(asctime)s - %(levelname)s - %(message)s')
         log_file = self.config.get('logging.file')
         
-        logging.basicConfig(
-            level=getattr(logging, log_level.upper()),
-            format=log_format,
-            filename=log_file,
-            encoding='utf-8',
-            force=True
-        )
+        handlers = []
+        if log_file:
+            handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+        if self.config.get('logging.console', True) or not handlers:
+            handlers.append(logging.StreamHandler())
+        for handler in handlers:
+            handler.setLevel(getattr(logging, log_level.upper()))
+            handler.setFormatter(logging.Formatter(log_format))
         
-        if self.config.get('logging.console', True):
-            console_handler = logging.StreamHandler()
-            console_handler.setLevel(getattr(logging, log_level.upper()))
-            console_handler.setFormatter(logging.Formatter(log_format))
-            logging.getLogger().addHandler(console_handler)
+        if self.log_listener is not None:
+            atexit.unregister(self.log_listener.stop)
+            self.log_listener.stop()
+        logging.getLogger().setLevel(getattr(logging, log_level.upper()))
+        self.log_listener = start_log_listener(handlers, self.config.get('logging.rate_limit_interval', 5.0))
+
+    def build_streams(self):
+        streams = OrderedDict()
+        for index, options in enumerate(self.config.get('cameras') or [{}]):
+            default_id = f"{socket.gethostname()}-{uuid.getnode() & 0xffffff:06x}/camera{index}"
+            stream_id = str(options.get('stream_id', self.config.get('camera.stream_id', default_id)))
+            if stream_id in streams:
+                stream_id = f"{stream_id}-{index}"
+            streams[stream_id] = CameraStream(stream_id, self.config, options)
+        return streams
+
+    def select_streams(self, stream_id=None):
+        if stream_id is None:
+            return list(self.streams.values())
+        stream = self.streams.get(stream_id)
+        return [stream] if stream is not None else []
+
+    def active_streams(self):
+        return [stream for stream in self.streams.values() if stream.active]
+
+    def stop_streams(self):
+        for stream in self.streams.values():
+            stream.active = False
+        self.is_streaming = False
 
     def initialize_model(self):
+        with self.model_lock:
+            return self.load_model()
+
+    def load_model(self):
         try:
             if self.model is not None:
                 return True
@@ -118,9 +2009,16 @@ class RobustYOLOStreamer:
                 logging.error(f"Файл модели не найден: {self.model_path}")
                 return False
             
-            self.model = YOLO(self.model_path, task='detect')
+            backend = self.config.get('model.backend', 'ultralytics')
+            if backend not in MODEL_BACKENDS:
+                logging.error(f"Неизвестный бэкенд модели: {backend}")
+                return False
+            
+            self.model = MODEL_BACKENDS[backend](self.model_path, self.config)
             self.labels = self.model.names
-            logging.info(f"YOLO модель загружена. Классы: {len(self.labels)}")
+            logging.info(f"YOLO модель загружена ({backend}). Классы: {len(self.labels)}")
+            self.warm_up_model()
+            self.timeline.mark("model_ready")
             return True
             
         except Exception as e:
@@ -128,44 +2026,68 @@ class RobustYOLOStreamer:
             self.model = None
             return False
 
-    def initialize_camera(self):
+    def warm_up_model(self):
+        width = self.config.get('camera.width', 640)
+        height = self.config.get('camera.height', 480)
+        dummy_frame = np.zeros((height, width, 3), dtype=np.uint8)
+        for _ in range(self.warmup_runs):
+            self.model.predict(dummy_frame, self.confidence_thresh)
+            if len(self.streams) > 1:
+                self.model.predict_batch([dummy_frame] * len(self.streams), self.confidence_thresh)
+
+    def open_cameras(self, streams=None):
+        opened = []
+        for stream in self.select_streams() if streams is None else streams:
+            if stream.is_open() or self.initialize_camera(stream):
+                opened.append(stream)
+        if opened:
+            self.timeline.mark("camera_ready")
+        return opened
+
+    async def prepare_pipeline(self):
+        loop = asyncio.get_running_loop()
+        jobs = [loop.run_in_executor(None, self.initialize_model)]
+        if self.eager_camera:
+            jobs.append(loop.run_in_executor(None, self.open_cameras))
+        model_ready, *camera_ready = await asyncio.gather(*jobs)
+        cameras = f"{len(camera_ready[0])}/{len(self.streams)}" if camera_ready else 'отложены'
+        logging.info(f"Предварительная подготовка завершена: модель={model_ready}, камеры={cameras}")
+
+    def initialize_camera(self, stream):
         max_reconnects = self.config.get('camera.max_camera_reconnects', 5)
         
         for attempt in range(max_reconnects):
             try:
-                if self.camera is not None:
-                    self.camera.release()
-                    self.camera = None
+                stream.release()
                 
-                logging.info(f"Попытка инициализации камеры {attempt + 1}/{max_reconnects}...")
+                logging.info(f"Попытка инициализации камеры {stream.stream_id} {attempt + 1}/{max_reconnects}...")
                 
-                device_options = self.config.get('camera.device_options', [0])
-                target_width = self.config.get('camera.width', 640)
-                target_height = self.config.get('camera.height', 480)
-                target_fps = self.config.get('camera.fps', 30)
+                source_type = stream.source.get('type', 'v4l2')
+                if source_type not in CAPTURE_SOURCES:
+                    logging.error(f"Неизвестный тип источника кадров: {source_type}")
+                    return False
+                devices = stream.device_options if source_type == 'v4l2' else [stream.source.get('path')]
                 
-                for camera_option in device_options:
+                for camera_option in devices:
                     try:
-                        self.camera = cv2.VideoCapture(camera_option)
+                        stream.camera = CAPTURE_SOURCES[source_type](camera_option, stream.source, stream)
+                        stream.camera.set_decode_scale(self.source_decode_scale())
                         
-                        if self.camera.isOpened():
-                            time.sleep(0.5)
+                        if stream.camera.isOpened():
+                            time.sleep(stream.camera.warmup_delay)
                             
-                            ret, test_frame = self.camera.read()
+                            ret, test_frame = stream.camera.read()
                             if ret and test_frame is not None:
-                                self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, target_width)
-                                self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, target_height)
-                                self.camera.set(cv2.CAP_PROP_FPS, target_fps)
+                                stream.apply_settings()
                                 
-                                actual_width = self.camera.get(cv2.CAP_PROP_FRAME_WIDTH)
-                                actual_height = self.camera.get(cv2.CAP_PROP_FRAME_HEIGHT)
+                                actual_width = stream.camera.get(cv2.CAP_PROP_FRAME_WIDTH)
+                                actual_height = stream.camera.get(cv2.CAP_PROP_FRAME_HEIGHT)
                                 
-                                logging.info(f"Камера инициализирована: {camera_option}")
+                                logging.info(f"Камера {stream.stream_id} инициализирована: {source_type} {camera_option}")
                                 logging.info(f"Разрешение: {actual_width}x{actual_height}")
                                 return True
                             else:
-                                self.camera.release()
-                                self.camera = None
+                                stream.release()
                     except Exception as e:
                         logging.warning(f"Камера {camera_option} не доступна: {e}")
                         continue
@@ -179,128 +2101,322 @@ class RobustYOLOStreamer:
                 if attempt < max_reconnects - 1:
                     time.sleep(2)
         
-        logging.error("Не удалось инициализировать камеру после всех попыток")
+        logging.error(f"Не удалось инициализировать камеру {stream.stream_id} после всех попыток")
         return False
 
-    async def safe_capture_frame(self):
+    def source_decode_scale(self):
+        # Уменьшенное декодирование допустимо, только если кадр не перерисовывается и уходит клиенту как есть
+        return self.decode_scale if self.passthrough and not self.overlay.burn_in else 1
+
+    async def safe_capture_frame(self, stream):
+        return await asyncio.get_running_loop().run_in_executor(None, self.capture_frame, stream)
+
+    def capture_frame(self, stream):
         try:
-            if self.camera is None or not self.camera.isOpened():
-                logging.warning("Камера не инициализирована, попытка переподключения...")
-                if not self.initialize_camera():
+            if not stream.is_open():
+                logging.warning(f"Камера {stream.stream_id} не инициализирована, попытка переподключения...")
+                if not self.initialize_camera(stream):
                     return None, False
             
-            ret, frame = self.camera.read()
+            mode = self.capture_mode
+            if stream.settings_changed and mode != 'thread':
+                stream.apply_settings()
+                logging.info(f"Камера {stream.stream_id}: {stream.width}x{stream.height} @ {stream.fps} FPS")
+            
+            started = time.perf_counter()
+            if mode == 'thread':
+                if stream.grabber is None or not stream.grabber.running:
+                    stream.grabber = FrameGrabber(stream)
+                frame, jpeg, captured_at = stream.grabber.latest()
+                ret = frame is not None
+            else:
+                ret, frame = self.drain_camera(stream) if mode == 'drain' else stream.camera.read()
+                jpeg = getattr(stream.camera, 'last_jpeg', None)
+                captured_at = time.time()
+            self.observe_stage("capture", started)
             if not ret or frame is None:
-                self.consecutive_errors += 1
-                logging.warning(f"Ошибка захвата кадра (ошибка #{self.consecutive_errors})")
+                stream.consecutive_errors += 1
+                self.metrics.increment("camera_errors")
+                logging.warning(f"Ошибка захвата кадра {stream.stream_id} (ошибка #{stream.consecutive_errors})")
                 
-                if self.consecutive_errors >= self.max_consecutive_errors:
+                if stream.consecutive_errors >= self.max_consecutive_errors:
                     logging.error("Превышено максимальное количество ошибок, переинициализация камеры...")
-                    if not self.initialize_camera():
+                    if not self.initialize_camera(stream):
                         return None, False
-                    self.consecutive_errors = 0
+                    stream.consecutive_errors = 0
                 
                 return None, False
             
-            self.consecutive_errors = 0
+            stream.consecutive_errors = 0
+            stream.captured_at = captured_at
+            stream.captured_jpeg = jpeg if self.passthrough else None
             return frame, True
             
         except Exception as e:
             logging.error(f"Критическая ошибка при захвате кадра: {e}")
-            self.consecutive_errors += 1
+            stream.consecutive_errors += 1
+            self.metrics.increment("camera_errors")
             return None, False
 
-    def process_frame_with_yolo(self, frame):
+    def drain_camera(self, stream):
+        # Кадры, уже лежащие в буфере V4L2, отдаются мгновенно: вычитываем их, пока grab не начнет ждать новый
+        threshold = 0.5 / max(stream.fps, 1)
+        drained = 0
+        for drained in range(self.drain_limit):
+            started = time.perf_counter()
+            if not stream.camera.grab():
+                return False, None
+            if time.perf_counter() - started >= threshold:
+                break
+        stream.stale_frames += drained
+        return stream.camera.retrieve()
+
+    def process_frame_with_yolo(self, frame, frame_id=None, captured_at=None, stream=None):
+        stream = stream or next(iter(self.streams.values()))
+        return self.process_frames_with_yolo([(stream, frame, frame_id, captured_at)])[0]
+
+    def process_frames_with_yolo(self, batch):
         try:
             if self.model is None:
                 if not self.initialize_model():
-                    return frame, [], 0
+                    return [(frame, [], 0) for _, frame, _, _ in batch]
             
-            results = self.model(frame, verbose=False, conf=self.confidence_thresh)
-            detections = results[0].boxes
+            started = time.perf_counter()
+            for stream, frame, _, _ in batch:
+                stream.motion_gate.observe(frame)
+            started = self.observe_stage("motion_gate", started)
             
-            object_count = 0
-            detection_data = []
+            detections = [None] * len(batch)
+            fresh = [True] * len(batch)
+            pending = []
+            propagated = False
+            for index, (stream, frame, _, _) in enumerate(batch):
+                if not stream.tracker.should_detect():
+                    detections[index] = stream.tracker.propagate(frame)
+                    propagated = True
+                elif stream.last_detections is not None and not stream.motion_gate.should_infer():
+                    detections[index] = stream.last_detections
+                    fresh[index] = False
+                else:
+                    pending.append(index)
+            if propagated:
+                started = self.observe_stage("tracking", started)
             
-            for i in range(len(detections)):
-                xyxy_tensor = detections[i].xyxy.cpu()
-                xyxy = xyxy_tensor.numpy().squeeze()
-                xmin, ymin, xmax, ymax = xyxy.astype(int)
-                
-                classidx = int(detections[i].cls.item())
-                classname = self.labels[classidx]
-                confidence = detections[i].conf.item()
-                
-                if confidence > self.confidence_thresh:
-                    color = tuple(self.bbox_colors[classidx % len(self.bbox_colors)])
-                    
-                    cv2.rectangle(frame, (xmin, ymin), (xmax, ymax), color, 2)
-                    
-                    label = f'{classname}: {confidence*100:.1f}%'
-                    labelSize, baseLine = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
-                    label_ymin = max(ymin, labelSize[1] + 10)
-                    
-                    cv2.rectangle(frame, (xmin, label_ymin-labelSize[1]-10), 
-                                 (xmin+labelSize[0], label_ymin+baseLine-10), color, cv2.FILLED)
-                    cv2.putText(frame, label, (xmin, label_ymin-7), 
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1)
-                    
-                    object_count += 1
-                    detection_data.append({
-                        'class': classname,
-                        'confidence': float(confidence),
-                        'bbox': [int(xmin), int(ymin), int(xmax), int(ymax)],
-                        'class_id': classidx
-                    })
+            if pending:
+                now = time.time()
+                for index in pending:
+                    stream, captured_at = batch[index][0], batch[index][3]
+                    if captured_at is not None:
+                        stream.frame_age = now - captured_at
+                        self.record_stage("frame_age", stream.frame_age)
+                predictions = self.run_inference([batch[index] for index in pending])
+                started = self.observe_stage("inference", started)
+                for index, prediction in zip(pending, predictions):
+                    stream, frame = batch[index][:2]
+                    xyxy, confidences, class_ids = self.filter_detections(*prediction)
+                    track_ids = (stream.tracker.update(xyxy, confidences, class_ids, frame)
+                                 if stream.tracker.enabled else None)
+                    detections[index] = (xyxy, confidences, class_ids, track_ids)
             
-            if hasattr(self, 'current_fps'):
-                cv2.putText(frame, f'FPS: {self.current_fps:.1f}', (10, 20), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
-                cv2.putText(frame, f'Objects: {object_count}', (10, 50), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
+            results = []
+            for (stream, frame, frame_id, captured_at), detection, is_fresh in zip(batch, detections, fresh):
+                stream.last_detections = detection
+                xyxy, confidences, class_ids, track_ids = detection
+                detection_data = self.build_detection_data(xyxy, confidences, class_ids, track_ids)
+                if is_fresh:
+                    self.history.append(captured_at if captured_at is not None else time.time(),
+                                        frame_id if frame_id is not None else stream.sequence,
+                                        xyxy, confidences, class_ids, track_ids, stream.stream_id)
+                results.append((frame, detection_data, len(detection_data)))
+            started = self.observe_stage("postprocess", started)
             
-            return frame, detection_data, object_count
+            if self.overlay.burn_in:
+                for (stream, _, _, _), (frame, detection_data, object_count) in zip(batch, results):
+                    self.overlay.render(frame, detection_data, object_count, stream.current_fps)
+                self.observe_stage("draw", started)
+            
+            return results
             
         except Exception as e:
             logging.error(f"Ошибка обработки YOLO: {e}")
-            return frame, [], 0
+            return [(frame, [], 0) for _, frame, _, _ in batch]
+
+    def run_inference(self, batch):
+        predictions = [None] * len(batch)
+        plain = [index for index, (stream, _, _, _) in enumerate(batch) if not stream.tiler.active]
+        if len(plain) == 1:
+            predictions[plain[0]] = self.model.predict(batch[plain[0]][1], self.confidence_thresh)
+        elif plain:
+            frames = [batch[index][1] for index in plain]
+            for index, prediction in zip(plain, self.model.predict_batch(frames, self.confidence_thresh)):
+                predictions[index] = prediction
+        for index, (stream, frame, _, _) in enumerate(batch):
+            if stream.tiler.active:
+                predictions[index] = stream.tiler.detect(frame, self.model, self.confidence_thresh)
+        return predictions
+
+    def observe_stage(self, stage, started):
+        finished = time.perf_counter()
+        self.record_stage(stage, finished - started)
+        return finished
 
-    async def safe_send_frame(self, frame, detection_data, object_count):
+    def record_stage(self, stage, seconds):
+        self.metrics.observe(stage, seconds)
+        if self.stage_observer is not None:
+            self.stage_observer(stage, seconds)
+
+    def filter_detections(self, xyxy, confidences, class_ids):
+        mask = confidences > self.confidence_thresh
+        return xyxy[mask].astype(np.int32), confidences[mask].astype(np.float32), class_ids[mask].astype(np.int32)
+
+    def build_detection_data(self, xyxy, confidences, class_ids, track_ids=None):
+        labels = self.labels
+        detection_data = [
+            {
+                'class': labels[class_id],
+                'confidence': confidence,
+                'bbox': bbox,
+                'class_id': class_id
+            }
+            for bbox, confidence, class_id in zip(xyxy.tolist(), confidences.tolist(), class_ids.tolist())
+        ]
+        if track_ids is not None:
+            for detection, track_id in zip(detection_data, track_ids.tolist()):
+                detection['track_id'] = track_id
+        return detection_data
+
+    def encode_frame_message(self, frame, detection_data, object_count, frame_id, captured_at=None, stream=None):
         try:
-            if self.websocket is None or self.websocket.closed:
-                logging.warning("WebSocket соединение разорвано")
-                return False
+            stream = stream or next(iter(self.streams.values()))
+            started = time.perf_counter()
+            source_height, source_width = frame.shape[:2]
+            jpeg_bytes = stream.take_jpeg(frame_id) if frame_id is not None else None
+            jpeg_size = jpeg_dimensions(jpeg_bytes) if jpeg_bytes is not None and not self.overlay.burn_in else None
+            delta = (stream.delta.enabled and self.delta_supported and self.frame_protocol == BINARY_PROTOCOL
+                     and frame_id is not None)
+            tiles = None
             
-            jpeg_quality = self.config.get('stream.jpeg_quality', 70)
-            _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
-            base64_frame = base64.b64encode(buffer).decode('utf-8')
+            if jpeg_size is not None and not delta and self.bitrate.allows_passthrough(jpeg_size):
+                jpeg_quality = None
+                width, height = jpeg_size
+                self.metrics.increment("passthrough_frames")
+            else:
+                jpeg_quality, (width, height) = self.bitrate.current_settings(frame.shape)
+                if (width, height) != (source_width, source_height):
+                    frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+                if delta:
+                    tiles = stream.delta.plan(frame, frame_id)
+                if tiles is None:
+                    _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+                    jpeg_bytes = buffer.tobytes()
+            if (width, height) != (source_width, source_height):
+                detection_data = self.scale_detections(detection_data, width / source_width,
+                                                       height / source_height)
+            timestamp = captured_at if captured_at is not None else time.time()
+            
+            if self.frame_protocol == BINARY_PROTOCOL:
+                metadata = {
+                    "stream_id": stream.stream_id,
+                    "detections": detection_data,
+                    "object_count": object_count,
+                    "fps": stream.current_fps,
+                    "annotated": self.overlay.burn_in,
+                    "jpeg_quality": jpeg_quality,
+                    "resolution": [width, height]
+                }
+                if delta:
+                    metadata["keyframe_id"] = stream.delta.keyframe_for(frame_id)
+                if tiles is not None:
+                    params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+                    encoded = [(x, y, w, h, cv2.imencode('.jpg', frame[y:y + h, x:x + w], params)[1].tobytes())
+                               for x, y, w, h in tiles]
+                    message = pack_delta_frame(frame_id, timestamp, time.time(), metadata, encoded)
+                else:
+                    message = pack_binary_frame(frame_id, timestamp, time.time(), metadata, jpeg_bytes)
+                if delta:
+                    stream.delta.record(frame_id, tiles, len(message))
+                self.observe_stage("encode", started)
+                return message
+            
+            base64_frame = base64.b64encode(jpeg_bytes).decode('utf-8')
             
             message_data = {
                 "type": "video_frame",
                 "data": base64_frame,
-                "frame_id": self.frame_count,
-                "timestamp": time.time(),
+                "frame_id": frame_id,
+                "timestamp": timestamp,
+                "stream_id": stream.stream_id,
                 "detections": detection_data,
                 "object_count": object_count,
-                "fps": getattr(self, 'current_fps', 0)
+                "fps": stream.current_fps,
+                "annotated": self.overlay.burn_in,
+                "jpeg_quality": jpeg_quality,
+                "resolution": [width, height]
             }
+            message = json.dumps(message_data)
+            self.observe_stage("encode", started)
+            return message
+            
+        except Exception as e:
+            logging.error(f"Ошибка кодирования кадра: {e}")
+            return None
+
+    @staticmethod
+    def scale_detections(detection_data, scale_x, scale_y):
+        scaled = []
+        for detection in detection_data:
+            xmin, ymin, xmax, ymax = detection['bbox']
+            scaled.append(dict(detection, bbox=[int(xmin * scale_x), int(ymin * scale_y),
+                                                int(xmax * scale_x), int(ymax * scale_y)]))
+        return scaled
+
+    async def safe_send_frame(self, frame, detection_data, object_count, stream, frame_id, captured_at=None):
+        message = self.encode_frame_message(frame, detection_data, object_count, frame_id, captured_at, stream)
+        if message is None:
+            return False
+        return await self.send_frame_message(message, object_count, stream, frame_id)
+
+    async def send_frame_message(self, message, object_count, stream, frame_id=None):
+        try:
+            if self.websocket is None or self.websocket.closed:
+                logging.warning("WebSocket соединение разорвано")
+                return False
             
+            buffered_bytes = self.websocket.transport.get_write_buffer_size()
+            if self.bitrate.should_skip(buffered_bytes) or stream.delta.is_stale(frame_id):
+                self.metrics.increment("dropped_frames")
+                self.log_events.count("кадров пропущено")
+                stream.delta.discard(frame_id)
+                return True
+            
+            send_started = time.monotonic()
             await asyncio.wait_for(
-                self.websocket.send(json.dumps(message_data)),
+                self.websocket.send(message),
                 timeout=5.0
             )
+            send_time = time.monotonic() - send_started
+            stream.delta.commit(frame_id)
+            self.bitrate.observe_send(send_time, buffered_bytes)
+            self.record_stage("send", send_time)
+            self.metrics.increment("frames_sent")
+            self.metrics.increment("bytes_sent", len(message))
             
             self.frame_count += 1
+            stream.count_sent()
             self.last_successful_frame = time.time()
+            if self.frame_count == 1:
+                self.timeline.mark("first_frame_sent")
             
-            if self.frame_count % 30 == 0:
-                logging.info(f"Отправлен кадр {self.frame_count}, объектов: {object_count}")
+            self.log_events.count("кадров отправлено")
+            self.log_events.count("объектов", object_count)
             
             return True
             
         except asyncio.TimeoutError:
             logging.warning("Таймаут отправки кадра")
-            return False
+            self.metrics.increment("send_timeouts")
+            stream.delta.force_keyframe()
+            return self.bitrate.observe_timeout()
         except websockets.exceptions.ConnectionClosed:
             logging.warning("Соединение закрыто при отправке")
             return False
@@ -343,35 +2459,92 @@ class RobustYOLOStreamer:
                 
                 logging.info(f"Получено сообщение: {message_type}, команда: {command}")
                 
-                if message_type == "command":
+                if message_type == "protocol":
+                    protocol = data.get("protocol", JSON_PROTOCOL)
+                    if protocol in (BINARY_PROTOCOL, JSON_PROTOCOL):
+                        self.frame_protocol = protocol
+                        self.delta_supported = "delta" in data.get("features", [])
+                        logging.info(f"Согласован протокол кадров: {protocol}"
+                                     f"{', дельта-кадры' if self.delta_supported else ''}")
+                    else:
+                        logging.warning(f"Сервер предложил неизвестный протокол: {protocol}")
+                
+                elif message_type == "error":
+                    logging.error(f"Ошибка сервера: {data.get('message')}")
+                
+                elif message_type == "command":
+                    stream_id = data.get("stream_id")
+                    if command in ("start_stream", "stop_stream") and not self.select_streams(stream_id):
+                        logging.warning(f"Неизвестный поток: {stream_id}")
+                        await self.send_ack(command, "error", f"Неизвестный поток: {stream_id}", stream_id)
+                        continue
+                    
                     if command == "start_stream":
-                        if not self.is_streaming:
-                            logging.info("Получена команда start_stream")
-                            if not self.initialize_camera():
+                        streams = [stream for stream in self.select_streams(stream_id) if not stream.active]
+                        if streams:
+                            logging.info(f"Получена команда start_stream: {', '.join(s.stream_id for s in streams)}")
+                            if self.startup_task is not None and not self.startup_task.done():
+                                await asyncio.shield(self.startup_task)
+                            loop = asyncio.get_running_loop()
+                            opened = await loop.run_in_executor(None, self.open_cameras, streams)
+                            if not opened:
                                 logging.error("Не удалось инициализировать камеру")
                                 continue
-                            if not self.initialize_model():
+                            if not await loop.run_in_executor(None, self.initialize_model):
                                 logging.error("Не удалось инициализировать модель")
                                 continue
+                            for stream in opened:
+                                stream.reset()
+                                stream.active = True
                             self.is_streaming = True
-                            await self.send_ack("start_stream", "success", "Поток запущен")
+                            await self.send_ack("start_stream", "success",
+                                                f"Поток запущен: {', '.join(s.stream_id for s in opened)}", stream_id)
                         else:
                             logging.info("Поток уже запущен")
                             
                     elif command == "stop_stream":
-                        if self.is_streaming:
-                            logging.info("Получена команда stop_stream")
-                            self.is_streaming = False
-                            await self.send_ack("stop_stream", "success", "Поток остановлен")
+                        streams = [stream for stream in self.select_streams(stream_id) if stream.active]
+                        if streams:
+                            logging.info(f"Получена команда stop_stream: {', '.join(s.stream_id for s in streams)}")
+                            for stream in streams:
+                                stream.active = False
+                            self.is_streaming = bool(self.active_streams())
+                            await self.send_ack("stop_stream", "success", "Поток остановлен", stream_id)
                         else:
                             logging.info("Поток уже остановлен")
                             
+                    elif command == "request_keyframe":
+                        for stream in self.select_streams(stream_id):
+                            stream.delta.force_keyframe()
+                    
                     elif command == "update_threshold":
                         new_thresh = data.get("threshold", self.confidence_thresh)
                         old_thresh = self.confidence_thresh
                         self.confidence_thresh = new_thresh
                         logging.info(f"Порог уверенности изменен: {old_thresh} -> {new_thresh}")
-                        await self.send_ack("update_threshold", "success", f"Порог обновлен на {new_thresh}")
+                        await self.send_ack("update_threshold", "success", f"Порог обновлен на {new_thresh}",
+                                            request_id=data.get("request_id"))
+                    
+                    elif command == "set_config":
+                        values = data.get("values") or {data.get("key"): data.get("value")}
+                        staged, errors = self.config.update(values)
+                        if errors:
+                            logging.warning(f"Отклонено изменение конфигурации: {'; '.join(errors)}")
+                            await self.send_ack("set_config", "error", "; ".join(errors),
+                                                request_id=data.get("request_id"))
+                            continue
+                        try:
+                            changed, applied = self.apply_config(staged)
+                        except Exception as e:
+                            logging.error(f"Не удалось применить конфигурацию: {e}")
+                            await self.send_ack("set_config", "error", f"Не удалось применить: {e}",
+                                                request_id=data.get("request_id"))
+                            continue
+                        message = f"Применено: {', '.join(applied) or 'нет изменений'}"
+                        pending = [key for key in changed if key not in applied]
+                        if pending:
+                            message += f"; после перезапуска: {', '.join(pending)}"
+                        await self.send_ack("set_config", "success", message, request_id=data.get("request_id"))
                         
                     elif command == "get_status":
                         status = self.get_status()
@@ -379,21 +2552,51 @@ class RobustYOLOStreamer:
                             "type": "status",
                             "data": status
                         }))
+                    
+                    elif command == "get_detections":
+                        reply = {"type": "detections", "data": self.get_detections(data)}
+                        if "request_id" in data:
+                            reply["request_id"] = data["request_id"]
+                        await self.websocket.send(json.dumps(reply))
+                    
+                    elif command == "get_metrics":
+                        reply = {"type": "metrics", "data": self.get_metrics()}
+                        if "request_id" in data:
+                            reply["request_id"] = data["request_id"]
+                        await self.websocket.send(json.dumps(reply))
                         
             except asyncio.TimeoutError:
                 continue
             except Exception as e:
                 logging.error(f"Ошибка обработки команды: {e}")
 
-    async def send_ack(self, command, status, message):
+    async def send_hello(self):
+        protocols = [JSON_PROTOCOL]
+        if self.preferred_protocol == BINARY_PROTOCOL:
+            protocols.insert(0, BINARY_PROTOCOL)
+        try:
+            await self.websocket.send(json.dumps({
+                "type": "hello",
+                "protocols": protocols,
+                "streams": list(self.streams)
+            }))
+        except Exception as e:
+            logging.error(f"Ошибка отправки приветствия: {e}")
+
+    async def send_ack(self, command, status, message, stream_id=None, request_id=None):
         if self.websocket and not self.websocket.closed:
             try:
-                await self.websocket.send(json.dumps({
+                ack = {
                     "type": "ack",
                     "command": command,
                     "status": status,
                     "message": message
-                }))
+                }
+                if stream_id is not None:
+                    ack["stream_id"] = stream_id
+                if request_id is not None:
+                    ack["request_id"] = request_id
+                await self.websocket.send(json.dumps(ack))
             except Exception as e:
                 logging.error(f"Ошибка отправки подтверждения: {e}")
 
@@ -402,19 +2605,30 @@ class RobustYOLOStreamer:
             "streaming": self.is_streaming,
             "frame_count": self.frame_count,
             "fps": getattr(self, 'current_fps', 0),
-            "camera_initialized": self.camera is not None and self.camera.isOpened(),
+            "camera_initialized": any(stream.is_open() for stream in self.streams.values()),
             "model_loaded": self.model is not None,
             "confidence_threshold": self.confidence_thresh,
-            "connection_active": self.connection_active
+            "connection_active": self.connection_active,
+            "frame_protocol": self.frame_protocol,
+            "startup": self.timeline.as_dict(),
+            "detection_history": self.history.get_status(),
+            "bitrate": self.bitrate.get_status(),
+            "pacing": self.scheduler.get_status(),
+            "streams": {stream_id: stream.get_status() for stream_id, stream in self.streams.items()}
         }
 
     async def streaming_loop(self):
+        if self.config.get('stream.pipeline', False):
+            await self.pipelined_streaming_loop()
+            return
+        
         logging.info("Запуск цикла потоковой передачи")
         
         fps_counter = 0
         fps_time = time.time()
         last_health_check = time.time()
         health_check_interval = 30  
+        self.scheduler = FrameScheduler()
 
         while self.is_streaming and not self.shutdown_requested:
             try:
@@ -429,34 +2643,219 @@ class RobustYOLOStreamer:
                         break
                     last_health_check = current_time
                 
-                frame, success = await self.safe_capture_frame()
-                if not success:
+                batch = []
+                for stream in self.active_streams():
+                    frame, success = await self.safe_capture_frame(stream)
+                    if success:
+                        batch.append((stream, frame, stream.next_frame_id(), stream.captured_at))
+                if not batch:
                     await asyncio.sleep(0.1)
                     continue
                 
-                processed_frame, detection_data, object_count = self.process_frame_with_yolo(frame)
+                results = self.process_frames_with_yolo(batch)
                 
-                fps_counter += 1
+                fps_counter += len(batch)
                 if current_time - fps_time >= 1.0:
                     self.current_fps = fps_counter / (current_time - fps_time)
                     fps_counter = 0
                     fps_time = current_time
                 
-                send_success = await self.safe_send_frame(processed_frame, detection_data, object_count)
+                send_success = True
+                for (stream, _, frame_id, captured_at), (processed_frame, detection_data, object_count) in zip(batch, results):
+                    if stream.motion_gate.should_skip_send():
+                        continue
+                    send_success = await self.safe_send_frame(processed_frame, detection_data, object_count,
+                                                              stream, frame_id, captured_at)
+                    if not send_success:
+                        break
                 if not send_success:
                     logging.warning("Ошибка отправки, переподключение...")
                     break
                 
-                target_fps = self.config.get('stream.target_fps', 15)
-                await asyncio.sleep(max(0, 1.0 / target_fps - 0.01)) 
+                await self.scheduler.wait(self.config.stream.target_fps)
                 
             except Exception as e:
                 logging.error(f"Критическая ошибка в цикле потоковой передачи: {e}")
                 break
         
-        self.is_streaming = False
+        self.stop_streams()
         logging.info("Цикл потоковой передачи остановлен")
 
+    async def pipelined_streaming_loop(self):
+        logging.info("Запуск конвейерного цикла потоковой передачи")
+        
+        self.scheduler = FrameScheduler()
+        pipeline = PipelineEngine(self)
+        pipeline.start()
+        
+        fps_counter = 0
+        fps_time = time.time()
+        last_health_check = time.time()
+        health_check_interval = 30
+        
+        try:
+            while self.is_streaming and not self.shutdown_requested:
+                current_time = time.time()
+                if current_time - last_health_check > health_check_interval:
+                    if not await self.health_check():
+                        logging.warning("Проверка здоровья не пройдена, переподключение...")
+                        break
+                    last_health_check = current_time
+                
+                item = await pipeline.next_message()
+                if item is None:
+                    continue
+                message, object_count, stream, frame_id = item
+                
+                fps_counter += 1
+                if current_time - fps_time >= 1.0:
+                    self.current_fps = fps_counter / (current_time - fps_time)
+                    fps_counter = 0
+                    fps_time = current_time
+                
+                if not await self.send_frame_message(message, object_count, stream, frame_id):
+                    logging.warning("Ошибка отправки, переподключение...")
+                    break
+                
+        except Exception as e:
+            logging.error(f"Критическая ошибка в конвейерном цикле: {e}")
+        finally:
+            await asyncio.get_running_loop().run_in_executor(None, pipeline.stop)
+        
+        self.stop_streams()
+        logging.info("Конвейерный цикл потоковой передачи остановлен")
+
+    def apply_config(self, staged):
+        changed = self.config.diff(staged)
+        applied = []
+        rebuild = set()
+        for key in changed:
+            section = key.split('.', 1)[0]
+            if key in ('model.confidence_threshold', 'stream.target_fps', 'logging.summary_interval'):
+                pass
+            elif key in ('stream.jpeg_quality', 'stream.resize_output', 'stream.output_width',
+                         'stream.output_height') or section == 'adaptive_bitrate':
+                rebuild.add('bitrate')
+            elif key == 'stream.max_frame_skip':
+                rebuild.add('tracking')
+            elif key in ('camera.width', 'camera.height', 'camera.fps'):
+                rebuild.add('camera')
+            elif section in ('detection', 'colors', 'motion_gate', 'tracking', 'tiling', 'delta'):
+                rebuild.add(section)
+            else:
+                continue
+            applied.append(key)
+        
+        bitrate = AdaptiveBitrateController(staged) if 'bitrate' in rebuild else self.bitrate
+        overlay = OverlayRenderer(staged) if rebuild & {'detection', 'colors'} else self.overlay
+        components = {}
+        for stream in self.streams.values():
+            components[stream] = {
+                'motion_gate': MotionGate(staged) if 'motion_gate' in rebuild else stream.motion_gate,
+                'tracker': DetectionTracker(staged) if 'tracking' in rebuild else stream.tracker,
+                'tiler': TiledInference(staged) if 'tiling' in rebuild else stream.tiler,
+                'delta': DeltaEncoder(staged) if 'delta' in rebuild else stream.delta
+            }
+        
+        self.config.replace(staged)
+        if 'model.confidence_threshold' in changed:
+            self.confidence_thresh = self.config.model.confidence_threshold
+        if 'logging.summary_interval' in changed:
+            self.log_events.interval = self.config.logging.summary_interval
+        self.bitrate = bitrate
+        self.overlay = overlay
+        for stream, built in components.items():
+            for name, component in built.items():
+                setattr(stream, name, component)
+            if 'camera' in rebuild:
+                stream.configure(self.config)
+            if rebuild & {'detection', 'colors'} and isinstance(stream.camera, CaptureSource):
+                stream.camera.set_decode_scale(self.source_decode_scale())
+        
+        if applied:
+            logging.info(f"Применены параметры: {', '.join(applied)}")
+        return changed, applied
+
+    async def watch_config(self):
+        while not self.shutdown_requested:
+            interval = self.config.advanced.config_reload_interval
+            await asyncio.sleep(interval or 5.0)
+            if not interval:
+                continue
+            try:
+                staged = self.config.reload_if_changed()
+                if staged is None:
+                    continue
+                changed, applied = self.apply_config(staged)
+                if changed:
+                    logging.info(f"Конфигурация перечитана, изменено: {', '.join(changed)}")
+                pending = [key for key in changed if key not in applied]
+                if pending:
+                    logging.warning(f"Параметры вступят в силу после перезапуска: {', '.join(pending)}")
+            except Exception as e:
+                logging.error(f"Новая конфигурация не применена: {e}")
+
+    def get_detections(self, request):
+        class_id = request.get("class_id")
+        class_name = request.get("class")
+        if class_id is None and class_name is not None and self.labels is not None:
+            names = self.labels.items() if isinstance(self.labels, dict) else enumerate(self.labels)
+            class_id = next((index for index, name in names if name == class_name), -1)
+        
+        records = self.history.query(request.get("since"), request.get("until"), class_id,
+                                     min(int(request.get("limit", 500)), self.history.capacity),
+                                     request.get("stream_id"))
+        return records_to_dicts(records, self.labels, self.history.stream_ids)
+
+    def get_metrics(self):
+        metrics = self.metrics.snapshot()
+        metrics["gauges"] = self.metric_gauges()
+        return metrics
+
+    def metric_gauges(self):
+        return {
+            "streaming": int(self.is_streaming),
+            "connection_active": int(self.connection_active),
+            "fps": getattr(self, 'current_fps', 0),
+            "jpeg_quality": self.bitrate.get_status()["jpeg_quality"],
+            "active_streams": len(self.active_streams()),
+            "stale_frames": sum(stream.stale_frames for stream in self.streams.values()),
+            "motion_gate_hit_rate": float(np.mean([stream.motion_gate.get_status()["hit_rate"]
+                                                   for stream in self.streams.values()]))
+        }
+
+    async def start_metrics_server(self):
+        try:
+            self.metrics_server = await asyncio.start_server(
+                self.handle_metrics_request, self.metrics_host, self.metrics_port)
+            logging.info(f"Метрики доступны на http://{self.metrics_host}:{self.metrics_port}/metrics")
+        except OSError as e:
+            logging.error(f"Не удалось запустить сервер метрик: {e}")
+
+    async def handle_metrics_request(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5.0)
+            while (await asyncio.wait_for(reader.readline(), timeout=5.0)) not in (b'\r\n', b'\n', b''):
+                pass
+            
+            parts = request_line.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                status = "200 OK"
+                body = self.metrics.render_prometheus(self.metric_gauges()).encode('utf-8')
+            else:
+                status = "404 Not Found"
+                body = b"Not Found\n"
+            
+            writer.write(f"HTTP/1.1 {status}\r\n"
+                         f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                         f"Content-Length: {len(body)}\r\n"
+                         f"Connection: close\r\n\r\n".encode('latin-1') + body)
+            await writer.drain()
+        except Exception as e:
+            logging.warning(f"Ошибка обработки запроса метрик: {e}")
+        finally:
+            writer.close()
+
     async def manage_connection(self):
         self.reconnect_attempts = 0
         
@@ -472,8 +2871,13 @@ class RobustYOLOStreamer:
                     self.websocket = websocket
                     self.connection_active = True
                     self.reconnect_attempts = 0
+                    self.frame_protocol = JSON_PROTOCOL
+                    self.delta_supported = False
                     
                     logging.info("Успешное подключение к серверу")
+                    self.timeline.mark("connected")
+                    await self.send_hello()
+                    self.startup_task = asyncio.create_task(self.prepare_pipeline())
                     
                     message_task = asyncio.create_task(self.message_handler())
                     command_task = asyncio.create_task(self.process_commands())
@@ -502,8 +2906,11 @@ class RobustYOLOStreamer:
                 logging.error(f"Ошибка подключения: {e}")
             
             self.cleanup()
+            if self.shutdown_requested:
+                break
             
             self.reconnect_attempts += 1
+            self.metrics.increment("reconnects")
             if self.reconnect_attempts >= self.max_reconnect_attempts:
                 logging.error(f"Превышено максимальное количество попыток подключения ({self.max_reconnect_attempts})")
                 break
@@ -515,12 +2922,11 @@ class RobustYOLOStreamer:
     def cleanup(self):
         logging.info("Очистка ресурсов...")
         
-        self.is_streaming = False
+        self.stop_streams()
         self.connection_active = False
         
-        if self.camera:
-            self.camera.release()
-            self.camera = None
+        for stream in self.streams.values():
+            stream.release()
         
         if self.websocket:
             self.websocket = None
@@ -531,12 +2937,21 @@ class RobustYOLOStreamer:
             logging.info(f"Модель: {self.model_path}")
             logging.info(f"Сервер: {self.server_url}")
             
+            if self.metrics.enabled:
+                await self.start_metrics_server()
+            
+            watch_task = asyncio.create_task(self.watch_config())
             await self.manage_connection()
+            watch_task.cancel()
             
         except Exception as e:
             logging.error(f"Критическая ошибка: {e}")
         finally:
+            if self.metrics_server is not None:
+                self.metrics_server.close()
+            self.history.close()
             self.cleanup()
+            self.log_events.flush()
             logging.info("Robust YOLO Streamer завершен")
 
 def main():
@@ -3,7 +3,9 @@ package com.example.cv_cam_android;
 import android.content.Intent;
 import android.content.SharedPreferences;
 import android.graphics.Bitmap;
-import android.graphics.BitmapFactory;
+import android.graphics.Canvas;
+import android.graphics.Color;
+import android.graphics.Paint;
 import android.os.Bundle;
 import android.os.Handler;
 import android.util.Log;
@@ -16,14 +18,24 @@ import android.widget.Toast;
 import androidx.appcompat.app.AppCompatActivity;
 import androidx.appcompat.widget.Toolbar;
 
+import org.json.JSONArray;
+import org.json.JSONObject;
+
 public class MainActivity extends AppCompatActivity implements VideoClient.VideoFrameListener {
 
     private static final String TAG = "MainActivity";
+    private static final int[][] BBOX_COLORS = {
+            {164, 120, 87}, {68, 148, 228}, {93, 97, 209}, {178, 182, 133}, {88, 159, 106},
+            {96, 202, 231}, {159, 124, 168}, {169, 162, 241}, {98, 118, 150}, {172, 176, 184}
+    };
     private VideoClient videoClient;
     private ImageView imageView;
     private Button btnStart, btnStop;
     private boolean isConnected = false;
     private long lastFrameTime = 0;
+    private final Paint boxPaint = new Paint();
+    private final Paint labelBackgroundPaint = new Paint();
+    private final Paint labelTextPaint = new Paint(Paint.ANTI_ALIAS_FLAG);
 
     @Override
     protected void onCreate(Bundle savedInstanceState) {
@@ -90,16 +102,20 @@ public class MainActivity extends AppCompatActivity implements VideoClient.Video
     }
 
     @Override
-    public void onFrameReceived(byte[] frameData) {
+    public void onFrameReceived(Bitmap frame, JSONArray detections, boolean annotated) {
         runOnUiThread(() -> {
             try {
                 long currentTime = System.currentTimeMillis();
                 long timeDiff = currentTime - lastFrameTime;
                 lastFrameTime = currentTime;
 
-                Log.d(TAG, "Displaying frame, size: " + frameData.length + " bytes, time since last: " + timeDiff + "ms");
+                Log.d(TAG, "Displaying frame " + frame.getWidth() + "x" + frame.getHeight()
+                        + ", time since last: " + timeDiff + "ms");
 
-                Bitmap bitmap = BitmapFactory.decodeByteArray(frameData, 0, frameData.length);
+                Bitmap bitmap = frame;
+                if (bitmap != null && !annotated && detections != null && detections.length() > 0) {
+                    bitmap = drawDetections(bitmap, detections);
+                }
                 if (bitmap != null) {
                     imageView.setImageBitmap(bitmap);
                     Log.d(TAG, "Frame displayed successfully");
@@ -114,6 +130,47 @@ public class MainActivity extends AppCompatActivity implements VideoClient.Video
         });
     }
 
+    private Bitmap drawDetections(Bitmap source, JSONArray detections) {
+        Bitmap bitmap = source.isMutable() ? source : source.copy(Bitmap.Config.ARGB_8888, true);
+        Canvas canvas = new Canvas(bitmap);
+
+        boxPaint.setStyle(Paint.Style.STROKE);
+        boxPaint.setStrokeWidth(2f);
+        labelBackgroundPaint.setStyle(Paint.Style.FILL);
+        labelTextPaint.setColor(Color.BLACK);
+        labelTextPaint.setTextSize(Math.max(12f, bitmap.getHeight() / 40f));
+
+        for (int i = 0; i < detections.length(); i++) {
+            JSONObject detection = detections.optJSONObject(i);
+            JSONArray bbox = detection != null ? detection.optJSONArray("bbox") : null;
+            if (bbox == null || bbox.length() < 4) {
+                continue;
+            }
+
+            int[] bgr = BBOX_COLORS[Math.abs(detection.optInt("class_id", 0)) % BBOX_COLORS.length];
+            int color = Color.rgb(bgr[2], bgr[1], bgr[0]);
+            float left = (float) bbox.optDouble(0);
+            float top = (float) bbox.optDouble(1);
+            float right = (float) bbox.optDouble(2);
+            float bottom = (float) bbox.optDouble(3);
+
+            boxPaint.setColor(color);
+            canvas.drawRect(left, top, right, bottom, boxPaint);
+
+            String label = detection.optString("class", "") + ": "
+                    + Math.round(detection.optDouble("confidence", 0) * 100) + "%";
+            Paint.FontMetrics metrics = labelTextPaint.getFontMetrics();
+            float labelHeight = metrics.descent - metrics.ascent;
+            float labelTop = Math.max(0f, top - labelHeight);
+
+            labelBackgroundPaint.setColor(color);
+            canvas.drawRect(left, labelTop, left + labelTextPaint.measureText(label) + 4f,
+                    labelTop + labelHeight, labelBackgroundPaint);
+            canvas.drawText(label, left + 2f, labelTop - metrics.ascent, labelTextPaint);
+        }
+        return bitmap;
+    }
+
     @Override
     public void onConnectionStatusChanged(boolean connected) {
         runOnUiThread(() -> {
@@ -1,18 +1,32 @@
 package com.example.cv_cam_android;
 
+import android.graphics.Bitmap;
+import android.graphics.BitmapFactory;
+import android.graphics.Canvas;
 import android.util.Log;
 import org.java_websocket.client.WebSocketClient;
 import org.java_websocket.handshake.ServerHandshake;
+import org.json.JSONArray;
 import org.json.JSONObject;
 import java.net.URI;
+import java.nio.ByteBuffer;
+import java.nio.charset.StandardCharsets;
+import java.util.HashMap;
+import java.util.Map;
 
 public class VideoClient {
     private static final String TAG = "VideoClient";
+    private static final String BINARY_PROTOCOL = "binary_v1";
+    private static final int FRAME_HEADER_SIZE = 28;
+    private static final byte FRAME_PROTOCOL_VERSION = 1;
+    private static final byte FRAME_TYPE_VIDEO = 1;
+    private static final byte FRAME_TYPE_DELTA = 2;
     private WebSocketClient webSocketClient;
     private final VideoFrameListener frameListener;
+    private final Map<String, Bitmap> composites = new HashMap<>();
 
     public interface VideoFrameListener {
-        void onFrameReceived(byte[] frameData);
+        void onFrameReceived(Bitmap frame, JSONArray detections, boolean annotated);
         void onConnectionStatusChanged(boolean connected);
         void onError(String error);
     }
@@ -35,9 +49,15 @@ public class VideoClient {
                         frameListener.onConnectionStatusChanged(true);
                     }
 
+                    requestBinaryProtocol();
                     sendCommand("status");
                 }
 
+                @Override
+                public void onMessage(ByteBuffer bytes) {
+                    handleBinaryFrame(bytes);
+                }
+
                 @Override
                 public void onMessage(String message) {
                     Log.d(TAG, "Raw message length: " + message.length() + " chars");
@@ -57,8 +77,13 @@ public class VideoClient {
                                     byte[] decodedFrame = android.util.Base64.decode(frameData, android.util.Base64.DEFAULT);
                                     Log.d(TAG, "Decoded frame size: " + decodedFrame.length + " bytes");
 
-                                    if (frameListener != null) {
-                                        frameListener.onFrameReceived(decodedFrame);
+                                    Bitmap bitmap = BitmapFactory.decodeByteArray(decodedFrame, 0, decodedFrame.length);
+                                    if (bitmap == null) {
+                                        Log.e(TAG, "Failed to decode frame");
+                                    } else if (frameListener != null) {
+                                        frameListener.onFrameReceived(bitmap,
+                                                json.optJSONArray("detections"),
+                                                json.optBoolean("annotated", true));
                                         Log.d(TAG, "Frame delivered to listener");
                                     } else {
                                         Log.e(TAG, "Frame listener is null!");
@@ -115,6 +140,7 @@ public class VideoClient {
 
                 @Override
                 public void onClose(int code, String reason, boolean remote) {
+                    composites.clear();
                     Log.w(TAG, "WebSocket CLOSED - Code: " + code + ", Reason: " + reason + ", Remote: " + remote);
 
                     if (frameListener != null) {
@@ -162,6 +188,107 @@ public class VideoClient {
         }
     }
 
+    private void requestBinaryProtocol() {
+        try {
+            JSONObject jsonCommand = new JSONObject();
+            jsonCommand.put("command", "set_protocol");
+            jsonCommand.put("protocol", BINARY_PROTOCOL);
+            jsonCommand.put("delta", true);
+            webSocketClient.send(jsonCommand.toString());
+            Log.d(TAG, "Requested frame protocol: " + BINARY_PROTOCOL);
+        } catch (Exception e) {
+            Log.e(TAG, "Protocol negotiation error: " + e.getMessage());
+        }
+    }
+
+    private void handleBinaryFrame(ByteBuffer bytes) {
+        try {
+            if (bytes.remaining() < FRAME_HEADER_SIZE
+                    || bytes.get() != 'C' || bytes.get() != 'V'
+                    || bytes.get() != FRAME_PROTOCOL_VERSION) {
+                Log.e(TAG, "Unsupported binary frame");
+                return;
+            }
+
+            byte frameType = bytes.get();
+            long frameId = bytes.getInt() & 0xFFFFFFFFL;
+            double timestamp = bytes.getDouble();
+            double encodeTimestamp = bytes.getDouble();
+            int metadataLength = bytes.getInt();
+
+            if ((frameType != FRAME_TYPE_VIDEO && frameType != FRAME_TYPE_DELTA)
+                    || metadataLength < 0 || metadataLength > bytes.remaining()) {
+                Log.e(TAG, "Malformed binary frame " + frameId);
+                return;
+            }
+
+            byte[] metadata = new byte[metadataLength];
+            bytes.get(metadata);
+            JSONObject json = new JSONObject(new String(metadata, StandardCharsets.UTF_8));
+
+            byte[] frameData = new byte[bytes.remaining()];
+            bytes.get(frameData);
+            Log.d(TAG, "Binary frame " + frameId + ": " + frameData.length + " bytes, objects: "
+                    + json.optInt("object_count", 0) + ", encode delay: "
+                    + Math.round((encodeTimestamp - timestamp) * 1000) + "ms");
+
+            Bitmap bitmap = frameType == FRAME_TYPE_DELTA
+                    ? applyDelta(json, frameData)
+                    : applyKeyframe(json, frameData);
+            if (frameListener != null && bitmap != null) {
+                frameListener.onFrameReceived(bitmap, json.optJSONArray("detections"),
+                        json.optBoolean("annotated", true));
+            }
+        } catch (Exception e) {
+            Log.e(TAG, "Binary frame parsing error: " + e.getMessage());
+            if (frameListener != null) {
+                frameListener.onError("Binary frame parsing failed");
+            }
+        }
+    }
+
+    private Bitmap applyKeyframe(JSONObject json, byte[] frameData) {
+        Bitmap bitmap = BitmapFactory.decodeByteArray(frameData, 0, frameData.length);
+        if (bitmap != null && json.has("keyframe_id")) {
+            composites.put(json.optString("stream_id", ""), bitmap.copy(Bitmap.Config.ARGB_8888, true));
+        }
+        return bitmap;
+    }
+
+    private Bitmap applyDelta(JSONObject json, byte[] frameData) {
+        String streamId = json.optString("stream_id", "");
+        Bitmap composite = composites.get(streamId);
+        JSONArray resolution = json.optJSONArray("resolution");
+        JSONArray tiles = json.optJSONArray("tiles");
+        int offset = 0;
+
+        for (int i = 0; tiles != null && i < tiles.length(); i++) {
+            JSONArray tile = tiles.optJSONArray(i);
+            int x = tile.optInt(0), y = tile.optInt(1), w = tile.optInt(2), h = tile.optInt(3);
+            int length = tile.optInt(4);
+            Bitmap tileBitmap = BitmapFactory.decodeByteArray(frameData, offset, length);
+            offset += length;
+            if (tileBitmap == null) {
+                continue;
+            }
+
+            boolean fullFrame = x == 0 && y == 0 && resolution != null
+                    && w == resolution.optInt(0) && h == resolution.optInt(1);
+            if (fullFrame) {
+                composite = tileBitmap.copy(Bitmap.Config.ARGB_8888, true);
+                composites.put(streamId, composite);
+            } else if (composite != null) {
+                new Canvas(composite).drawBitmap(tileBitmap, x, y, null);
+            }
+        }
+
+        if (composite == null) {
+            Log.w(TAG, "Delta frame for stream " + streamId + " before its keyframe");
+            return null;
+        }
+        return composite.copy(Bitmap.Config.ARGB_8888, false);
+    }
+
     public void disconnect() {
         if (webSocketClient != null) {
             webSocketClient.close();